@@ -1,8 +1,10 @@
 import os
 from flask import Flask
+from sqlalchemy import inspect
 from .config import Config
-from .extensions import db, migrate
+from .extensions import db, migrate, telegram
 from .commands import register_cli
+from .services.conv_state import init_conv_state
 
 
 def create_app():
@@ -15,6 +17,8 @@ def create_app():
     # Extensiones
     db.init_app(app)
     migrate.init_app(app, db)
+    telegram.init_app(app)
+    init_conv_state(app)
 
     # Blueprints
     from .blueprints.admin_bp import admin_bp
@@ -25,9 +29,12 @@ def create_app():
     app.register_blueprint(whitelist_bp)
     app.register_blueprint(bot_bp)
 
-    # DB
+    # DB: create_all solo si las migraciones no llevan el esquema. Con
+    # alembic_version las tablas nuevas las crea `db upgrade` (que además
+    # carga datos); crearlas aquí antes haría fallar la migración.
     with app.app_context():
-        db.create_all()
+        if not inspect(db.engine).has_table("alembic_version"):
+            db.create_all()
 
     # Webhook (prod) si tienes dominio público fijo:
     # from .services.telegram import set_webhook
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
 import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
 from ..extensions import db
-from ..models import PaymentRequest, Evidence, Estado, Sociedad
+from ..models import PaymentRequest, Evidence, Estado, UpdateStatus
 from ..services.telegram import send_message
-from sqlalchemy import or_, func
-from zoneinfo import ZoneInfo
+from ..services.pagination import decode_cursor, keyset_page
+from ..services.payment_filters import PaymentFilter
+from ..services import rollup
+from ..services.read_models import projected, payment_rows
 
 admin_bp = Blueprint("admin_bp", __name__)
 
@@ -56,209 +58,205 @@ def root():
     )
 
 
+def duplicate_payments(pagos):
+    """
+    {payment_id: [otros payment_id]} para pagos cuya evidencia (por SHA-256)
+    también está adjunta a otro pago. Una sola consulta por página.
+    """
+    by_pid = {}
+    for p in pagos:
+        hashes = {ev.sha256 for ev in (p.evidences or []) if ev.sha256}
+        if hashes:
+            by_pid[p.id] = hashes
+    all_hashes = set().union(*by_pid.values()) if by_pid else set()
+    if not all_hashes:
+        return {}
+    owners = {}
+    rows = (
+        db.session.query(Evidence.sha256, Evidence.payment_id)
+        .filter(Evidence.sha256.in_(all_hashes))
+        .distinct()
+        .all()
+    )
+    for sha, pid in rows:
+        owners.setdefault(sha, set()).add(pid)
+    result = {}
+    for pid, hashes in by_pid.items():
+        others = set()
+        for sha in hashes:
+            others |= owners.get(sha, set())
+        others.discard(pid)
+        if others:
+            result[pid] = sorted(others)
+    return result
+
+
 @admin_bp.get("/admin")
 @require_admin
 def admin():
-    estado = request.args.get("estado", "").strip()
-    q_str = request.args.get("q", "").strip()
-    desde_str = request.args.get("desde", "").strip()
-    hasta_str = request.args.get("hasta", "").strip()
-    sociedad_str = request.args.get("sociedad", "").strip().upper()
-    valor_min_str = request.args.get("valor_min", "").strip()
-    valor_max_str = request.args.get("valor_max", "").strip()
-    page = int(request.args.get("page", 1))
+    flt = PaymentFilter.from_args(
+        request.args, current_app.config.get("TIMEZONE", "America/Bogota")
+    )
+    tz = flt.tz
+    cursor = decode_cursor(request.args.get("c", "").strip())
     per_page = int(request.args.get("per_page", 25))
 
-    vmin = None
-    vmax = None
-    if valor_min_str:
-        try:
-            vmin = int(valor_min_str)
-        except Exception:
-            vmin = None
-    if valor_max_str:
-        try:
-            vmax = int(valor_max_str)
-        except Exception:
-            vmax = None
-    if vmin is not None and vmax is not None and vmin > vmax:
-        vmin, vmax = vmax, vmin
-
-    # Base para totales por estado (no filtra 'estado' para ver distribución completa)
-    base = PaymentRequest.query
-    if q_str:
-        like = f"%{q_str}%"
-        base = base.filter(
-            or_(
-                PaymentRequest.cliente.like(like),
-                PaymentRequest.medio_pago.like(like),
-                PaymentRequest.sucursal.like(like),
-            )
-        )
-    tz_name = current_app.config.get("TIMEZONE", "America/Bogota")
-    try:
-        tz = ZoneInfo(tz_name)
-    except Exception:
-        tz = datetime.timezone.utc
-    if desde_str:
-        try:
-            d_local = datetime.datetime.strptime(desde_str, "%Y-%m-%d").replace(tzinfo=tz)
-            d_utc = d_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            base = base.filter(PaymentRequest.created_at >= d_utc)
-        except Exception:
-            pass
-    if hasta_str:
-        try:
-            h_local = (
-                datetime.datetime.strptime(hasta_str, "%Y-%m-%d")
-                + datetime.timedelta(days=1)
-            ).replace(tzinfo=tz)
-            h_utc = h_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            base = base.filter(PaymentRequest.created_at < h_utc)
-        except Exception:
-            pass
-    # Filtro sociedad (en agregados)
-    soc_val = None
-    if sociedad_str in [s.value for s in Sociedad]:
-        soc_val = Sociedad(sociedad_str)
-        base = base.filter(PaymentRequest.sociedad == soc_val)
-    if vmin is not None:
-        base = base.filter(PaymentRequest.valor >= vmin)
-    if vmax is not None:
-        base = base.filter(PaymentRequest.valor <= vmax)
-
-    # Conteo por estado
-    counts_raw = (
-        base.with_entities(PaymentRequest.estado, func.count())
-        .group_by(PaymentRequest.estado)
-        .all()
-    )
-    counts_by_status = {e.value: 0 for e in Estado}
-    for est, cnt in counts_raw:
-        try:
-            key = est.value if est else ""
-        except Exception:
-            key = str(est) if est else ""
-        if key:
-            counts_by_status[key] = int(cnt)
-
-    # Suma total y por estado (valor)
-    sum_total = base.with_entities(func.sum(PaymentRequest.valor)).scalar() or 0
-    sums_raw = (
-        base.with_entities(PaymentRequest.estado, func.sum(PaymentRequest.valor))
-        .group_by(PaymentRequest.estado)
-        .all()
-    )
-    sums_by_status = {e.value: 0 for e in Estado}
-    for est, s in sums_raw:
-        try:
-            key = est.value if est else ""
-        except Exception:
-            key = str(est) if est else ""
-        if key:
-            sums_by_status[key] = int(s or 0)
-
-    # Query principal para listado
-    query = PaymentRequest.query
-    if estado in [e.value for e in Estado]:
-        query = query.filter(PaymentRequest.estado == Estado(estado))
-    if q_str:
-        like = f"%{q_str}%"
-        query = query.filter(
-            or_(
-                PaymentRequest.cliente.like(like),
-                PaymentRequest.medio_pago.like(like),
-                PaymentRequest.sucursal.like(like),
-            )
-        )
-    # Filtros de fecha interpretados en zona local y convertidos a UTC
-    if desde_str:
-        try:
-            d_local = datetime.datetime.strptime(desde_str, "%Y-%m-%d").replace(tzinfo=tz)
-            d_utc = d_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            query = query.filter(PaymentRequest.created_at >= d_utc)
-        except Exception:
-            pass
-    if hasta_str:
-        try:
-            h_local = (
-                datetime.datetime.strptime(hasta_str, "%Y-%m-%d")
-                + datetime.timedelta(days=1)
-            ).replace(tzinfo=tz)
-            h_utc = h_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            query = query.filter(PaymentRequest.created_at < h_utc)
-        except Exception:
-            pass
-    if soc_val is not None:
-        query = query.filter(PaymentRequest.sociedad == soc_val)
-    if vmin is not None:
-        query = query.filter(PaymentRequest.valor >= vmin)
-    if vmax is not None:
-        query = query.filter(PaymentRequest.valor <= vmax)
-
-    total = query.count()
-    pagos = (
-        query.order_by(PaymentRequest.created_at.desc())
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
+    # Conteos, sumas y total del listado: del rollup diario si los filtros lo
+    # permiten; si no, una sola consulta agregada sobre payment_request
+    if rollup.can_serve(flt):
+        counts_by_status, sums_by_status, sum_total, total = rollup.aggregates(flt)
+    else:
+        counts_by_status, sums_by_status, sum_total, total = flt.aggregates()
+
+    # Paginación por clave (created_at, id): sin OFFSET; solo las columnas
+    # que usa la vista, evidencias en una consulta IN para toda la página.
+    # `total` solo estima el número de páginas: si hay siguiente lo decide la consulta
+    raw, page, pages, nav = keyset_page(
+        projected(flt.apply(PaymentRequest.query)),
+        PaymentRequest,
+        cursor,
+        per_page,
+        total,
     )
+    pagos = payment_rows(raw, tz)
 
-    # Formateo local de timestamps para la vista
+    # Comprobantes repetidos (mismo hash adjunto a otro pago)
+    dup_map = duplicate_payments(pagos)
     for p in pagos:
-        try:
-            if p.created_at:
-                _c = p.created_at.replace(tzinfo=datetime.timezone.utc).astimezone(tz)
-                p.created_local_str = _c.strftime("%Y-%m-%d %H:%M")
-            else:
-                p.created_local_str = None
-            if p.updated_at:
-                _u = p.updated_at.replace(tzinfo=datetime.timezone.utc).astimezone(tz)
-                p.updated_local_str = _u.strftime("%Y-%m-%d %H:%M")
-            else:
-                p.updated_local_str = None
-        except Exception:
-            p.created_local_str = None
-            p.updated_local_str = None
+        p.duplicate_of = dup_map.get(p.id, [])
 
     return render_template(
         "admin.html",
         pagos=pagos,
         Estado=Estado,
         page=page,
+        pages=pages,
+        nav=nav,
         per_page=per_page,
         total=total,
-        estado=estado,
-        q=q_str,
-        desde=desde_str,
-        hasta=hasta_str,
-        sociedad=sociedad_str,
+        estado=flt.estado_str,
+        q=flt.q_str,
+        desde=flt.desde_str,
+        hasta=flt.hasta_str,
+        sociedad=flt.sociedad_str,
         counts_by_status=counts_by_status,
         sum_total=sum_total,
         sums_by_status=sums_by_status,
-        valor_min=valor_min_str,
-        valor_max=valor_max_str,
+        valor_min=flt.valor_min_str,
+        valor_max=flt.valor_max_str,
     )
 
 
+EVID_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _evidence_etag(version, size):
+    return f"{version}-{size or 'orig'}"
+
+
+@admin_bp.app_template_global()
+def evidence_url(ev, size=None):
+    """URL versionada por hash de contenido: cacheable como immutable."""
+    version = (ev.sha256 or "")[:16] or None
+    return url_for("admin_bp.evidence_view", evid_id=ev.id, size=size, v=version)
+
+
 @admin_bp.get("/evidence/<int:evid_id>")
 @require_admin
 def evidence_view(evid_id):
-    from flask import current_app, send_from_directory
+    from flask import current_app
+    from werkzeug.utils import send_from_directory
+    import mimetypes
+
+    size = request.args.get("size", "").strip().lower() or None
+    version = request.args.get("v", "").strip() or None
+    # Ruta rápida: URL versionada + ETag ya en el navegador -> 304 sin tocar la BD
+    if version and request.if_none_match.contains(_evidence_etag(version, size)):
+        resp = current_app.response_class(status=304)
+        resp.set_etag(_evidence_etag(version, size))
+        resp.headers["Cache-Control"] = f"private, max-age={EVID_IMMUTABLE_MAX_AGE}, immutable"
+        return resp
 
     ev = Evidence.query.get_or_404(evid_id)
-    return send_from_directory(
-        current_app.config["EVID_DIR"], ev.filename, as_attachment=False
-    )
+    filename = ev.filename
+    fallback = False
+    if size:
+        from ..services.thumbnails import variant_path, submit_variants
+
+        rel = variant_path(current_app, ev.filename, size)
+        if rel:
+            filename = rel
+        else:
+            # aún no existe (evidencia anterior al pipeline): se genera para la próxima.
+            # Se sirve el original sin cachear y con el ETag del original, para que
+            # la próxima petición de esta URL reciba la variante
+            submit_variants(current_app._get_current_object(), ev.filename)
+            size = None
+            fallback = True
+
+    current_version = (ev.sha256 or "")[:16] or None
+    etag = _evidence_etag(current_version, size) if current_version else True
+    immutable = bool(version and version == current_version and not fallback)
+
+    mode = current_app.config.get("EVID_SERVE_MODE", "python")
+    if mode == "x-accel":
+        # nginx sirve los bytes (location interna apuntando a EVID_DIR)
+        resp = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+        prefix = current_app.config.get("EVID_ACCEL_PREFIX", "/_evidencias/")
+        resp.headers["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{filename}"
+        if isinstance(etag, str):
+            resp.set_etag(etag)
+    else:
+        # python o x-sendfile: soporta Range y condicionales. X-Sendfile solo
+        # aquí (no USE_X_SENDFILE global): las descargas de EXPORT_DIR van por Python
+        resp = send_from_directory(
+            current_app.config["EVID_DIR"],
+            filename,
+            request.environ,
+            as_attachment=False,
+            conditional=True,
+            etag=etag,
+            max_age=current_app.get_send_file_max_age,
+            use_x_sendfile=mode == "x-sendfile",
+            response_class=current_app.response_class,
+        )
+    if immutable:
+        resp.headers["Cache-Control"] = f"private, max-age={EVID_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def _resolve_pending(pid, estado, **values):
+    """
+    PENDIENTE -> estado con un UPDATE condicional: si dos admins resuelven a
+    la vez solo uno cambia la fila, y solo ese mueve el rollup y avisa.
+    Retorna el pago actualizado, o None si ya no estaba pendiente.
+    """
+    values = {getattr(PaymentRequest, k): v for k, v in values.items()}
+    values[PaymentRequest.estado] = estado
+    values[PaymentRequest.updated_at] = datetime.datetime.utcnow()
+    n = PaymentRequest.query.filter(
+        PaymentRequest.id == pid,
+        PaymentRequest.estado == Estado.PENDIENTE,
+    ).update(values, synchronize_session=False)
+    if n != 1:
+        db.session.rollback()
+        PaymentRequest.query.get_or_404(pid)
+        return None
+    p = db.session.get(PaymentRequest, pid)
+    rollup.record_transition(p, Estado.PENDIENTE)
+    db.session.commit()
+    return p
 
 
 @admin_bp.post("/payments/<int:pid>/approve")
 @require_admin
 def approve(pid):
-    p = PaymentRequest.query.get_or_404(pid)
-    if p.estado == Estado.PENDIENTE:
-        p.estado = Estado.APROBADO
-        db.session.commit()
+    p = _resolve_pending(pid, Estado.APROBADO)
+    if p is not None:
         send_message(
             p.chat_id_respuesta,
             f"✅ Pago de <b>{p.cliente}</b> fue <b>APROBADO</b>.\nID: <b>{p.id}</b> | Valor: ${p.valor:,}",
@@ -269,12 +267,9 @@ def approve(pid):
 @admin_bp.post("/payments/<int:pid>/reject")
 @require_admin
 def reject(pid):
-    p = PaymentRequest.query.get_or_404(pid)
-    if p.estado == Estado.PENDIENTE:
-        motivo = (request.form.get("motivo") or "No cumple validación").strip()
-        p.estado = Estado.RECHAZADO
-        p.motivo_rechazo = motivo
-        db.session.commit()
+    motivo = (request.form.get("motivo") or "No cumple validación").strip()
+    p = _resolve_pending(pid, Estado.RECHAZADO, motivo_rechazo=motivo)
+    if p is not None:
         send_message(
             p.chat_id_respuesta,
             f"❌ Pago de <b>{p.cliente}</b> fue <b>RECHAZADO</b>.\nMotivo: {motivo}\nID: <b>{p.id}</b>",
@@ -282,24 +277,34 @@ def reject(pid):
     return redirect(url_for("admin_bp.admin"))
 
 
+@admin_bp.get("/stats/daily")
+@require_admin
+def stats_daily():
+    """Serie diaria desde el rollup: ?group=estado|sucursal|sociedad|medio_pago + filtros de fecha/sociedad/estado."""
+    flt = PaymentFilter.from_args(
+        request.args, current_app.config.get("TIMEZONE", "America/Bogota")
+    )
+    group = request.args.get("group", "").strip() or None
+    if group and group not in rollup.SERIES_GROUPS:
+        return jsonify({"error": "group inválido"}), 400
+    return jsonify({"group": group, "series": rollup.series(flt, group)})
+
+
 @admin_bp.get("/health")
 def health():
     return jsonify({"status": "ok"})
 
 
+@admin_bp.get("/health/queue")
+def health_queue():
+    from ..services.update_queue import queue_stats
+
+    return jsonify(queue_stats())
+
+
 # --- EXPORTAR BANDEJA A EXCEL ---
-@admin_bp.get("/payments/export-excel")
-@require_admin
-def export_payments_excel():
-    import os
-    from io import BytesIO
-    from flask import send_file, current_app
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment
-    from openpyxl.utils import get_column_letter
-    from openpyxl.drawing.image import Image as XLImage
-
-    include_images = request.args.get("imagenes", "").strip().lower() in [
+def _truthy(raw):
+    return (raw or "").strip().lower() in [
         "1",
         "true",
         "t",
@@ -307,222 +312,136 @@ def export_payments_excel():
         "si",
         "sí",
     ]
-    estado = request.args.get("estado")
-    q_str = (request.args.get("q") or "").strip()
-    desde_str = (request.args.get("desde") or "").strip()
-    hasta_str = (request.args.get("hasta") or "").strip()
-    sociedad_str = (request.args.get("sociedad") or "").strip().upper()
-    valor_min_str = (request.args.get("valor_min") or "").strip()
-    valor_max_str = (request.args.get("valor_max") or "").strip()
-
-    q = PaymentRequest.query
-    if estado in [e.value for e in Estado]:
-        q = q.filter(PaymentRequest.estado == Estado(estado))
-    if q_str:
-        like = f"%{q_str}%"
-        q = q.filter(
-            or_(
-                PaymentRequest.cliente.like(like),
-                PaymentRequest.medio_pago.like(like),
-                PaymentRequest.sucursal.like(like),
-            )
-        )
-    tz_name = current_app.config.get("TIMEZONE", "America/Bogota")
-    try:
-        tz = ZoneInfo(tz_name)
-    except Exception:
-        tz = datetime.timezone.utc
-    if desde_str:
-        try:
-            d_local = datetime.datetime.strptime(desde_str, "%Y-%m-%d").replace(tzinfo=tz)
-            d_utc = d_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            q = q.filter(PaymentRequest.created_at >= d_utc)
-        except Exception:
-            pass
-    if hasta_str:
-        try:
-            h_local = (
-                datetime.datetime.strptime(hasta_str, "%Y-%m-%d")
-                + datetime.timedelta(days=1)
-            ).replace(tzinfo=tz)
-            h_utc = h_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-            q = q.filter(PaymentRequest.created_at < h_utc)
-        except Exception:
-            pass
-    if sociedad_str in [s.value for s in Sociedad]:
-        q = q.filter(PaymentRequest.sociedad == Sociedad(sociedad_str))
-    # Filtro por valor
-    try:
-        vmin = int(valor_min_str) if valor_min_str else None
-    except Exception:
-        vmin = None
-    try:
-        vmax = int(valor_max_str) if valor_max_str else None
-    except Exception:
-        vmax = None
-    if vmin is not None and vmax is not None and vmin > vmax:
-        vmin, vmax = vmax, vmin
-    if vmin is not None:
-        q = q.filter(PaymentRequest.valor >= vmin)
-    if vmax is not None:
-        q = q.filter(PaymentRequest.valor <= vmax)
-    pagos = q.order_by(PaymentRequest.created_at.desc()).all()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pagos"
-
-    headers = [
-        "ID",
-        "Cliente",
-        "Valor",
-        "Medio de pago",
-        "Sucursal",
-        "Fecha consignación",
-        "Sociedad",
-        "Estado",
-        "Motivo rechazo",
-        "Creado UTC",
-        "Actualizado UTC",
-        "Creado (local)",
-        "Actualizado (local)",
-        "Telegram User ID",
-        "Chat ID respuesta",
-        "Evidencias (archivos)",
-    ]
-    ws.append(headers)
-    for col in range(1, len(headers) + 1):
-        c = ws.cell(row=1, column=col)
-        c.font = Font(bold=True)
-        c.alignment = Alignment(vertical="center")
-    ws.freeze_panes = "A2"
 
-    for p in pagos:
-        evids = ", ".join(ev.filename or "" for ev in (p.evidences or []))
-        ws.append(
-            [
-                p.id,
-                getattr(p, "cliente", None)
-                or getattr(
-                    p, "referencia", ""
-                ),
-                p.valor or 0,
-                p.medio_pago or "",
-                p.sucursal or "",
-                (p.fecha_consignacion.isoformat() if getattr(p, "fecha_consignacion", None) else ""),
-                (p.sociedad.value if getattr(p, "sociedad", None) else ""),
-                p.estado.value if p.estado else "",
-                p.motivo_rechazo or "",
-                (p.created_at.isoformat(sep=" ") if p.created_at else ""),
-                (p.updated_at.isoformat(sep=" ") if p.updated_at else ""),
-                (
-                    p.created_at and p.created_at.replace(tzinfo=datetime.timezone.utc)
-                    .astimezone(tz)
-                    .strftime("%Y-%m-%d %H:%M")
-                    or ""
-                ),
-                (
-                    p.updated_at and p.updated_at.replace(tzinfo=datetime.timezone.utc)
-                    .astimezone(tz)
-                    .strftime("%Y-%m-%d %H:%M")
-                    or ""
-                ),
-                p.telegram_user_id or "",
-                p.chat_id_respuesta or "",
-                evids,
-            ]
-        )
 
-    # formato numérico (columna Valor = 3)
-    for row in ws.iter_rows(min_row=2, min_col=3, max_col=3):
-        for cell in row:
-            cell.number_format = "#,##0"
-
-    widths = [8, 28, 14, 22, 22, 18, 14, 12, 28, 20, 20, 18, 18, 16, 16, 36]
-    for i, w in enumerate(widths, start=1):
-        ws.column_dimensions[get_column_letter(i)].width = w
-
-    # ----- Hoja con imágenes opcional -----
-    if include_images:
-        ws2 = wb.create_sheet(title="Evidencias")
-        ws2.append(["Pago ID", "Cliente", "Archivo", "Imagen"])
-        for col in range(1, 5):
-            c = ws2.cell(row=1, column=col)
-            c.font = Font(bold=True)
-            c.alignment = Alignment(vertical="center")
-        ws2.freeze_panes = "A2"
-        ws2.column_dimensions["A"].width = 10
-        ws2.column_dimensions["B"].width = 28
-        ws2.column_dimensions["C"].width = 36
-        ws2.column_dimensions["D"].width = 50  # donde anclamos la imagen
-
-        # límites para thumbnails (px)
-        MAX_W, MAX_H = 420, 300
-        IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
-
-        row_idx = 2
-        for p in pagos:
-            cliente = getattr(p, "cliente", None) or getattr(p, "referencia", "")
-            for ev in p.evidences or []:
-                filename = ev.filename or ""
-                ext = os.path.splitext(filename)[1].lower()
-                img_path = os.path.join(current_app.config["EVID_DIR"], filename)
-                ws2.cell(row=row_idx, column=1, value=p.id)
-                ws2.cell(row=row_idx, column=2, value=cliente)
-                ws2.cell(row=row_idx, column=3, value=filename)
-
-                if ext in IMAGE_EXTS and os.path.exists(img_path):
-                    try:
-                        # Cargamos imagen y ajustamos tamaño
-                        from PIL import Image as PILImage
-
-                        with PILImage.open(img_path) as im:
-                            w, h = im.size
-                        scale = min(MAX_W / float(w or 1), MAX_H / float(h or 1), 1.0)
-                        target_w, target_h = int(w * scale), int(h * scale)
-
-                        xl_img = XLImage(img_path)
-                        xl_img.width = target_w
-                        xl_img.height = target_h
-                        anchor = f"D{row_idx}"
-                        ws2.add_image(xl_img, anchor)
-
-                        # Ajuste de alto de fila (puntos). Aproximación: px * 0.75
-                        ws2.row_dimensions[row_idx].height = max(
-                            22, int(target_h * 0.75)
-                        )
-                    except Exception as e:
-                        ws2.cell(
-                            row=row_idx, column=4, value=f"(No se pudo incrustar: {e})"
-                        )
-                        ws2.row_dimensions[row_idx].height = 22
-                else:
-                    # No imagen compatible (pdf u otro)
-                    ws2.cell(row=row_idx, column=4, value="(No es imagen o no existe)")
-                    ws2.row_dimensions[row_idx].height = 22
-
-                row_idx += 1
-
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-
-    suffix = ""
-    if estado:
-        suffix += f"_{estado.lower()}"
-    if sociedad_str:
-        suffix += f"_{sociedad_str.lower()}"
-    if desde_str or hasta_str:
-        suf_d = desde_str or ""
-        suf_h = hasta_str or ""
-        suffix += f"_{suf_d}_a_{suf_h}"
-    if include_images:
-        suffix += "_con_imagenes"
-
-    filename = f"bandeja_pagos{suffix}.xlsx"
+def _export_job_json(job):
+    data = {
+        "id": job.token,
+        "status": job.status.value,
+        "progress": job.progress,
+        "total": job.total,
+        "filename": job.filename,
+        "error": job.error,
+        "download_url": None,
+    }
+    if job.status == UpdateStatus.HECHO:
+        data["download_url"] = url_for("admin_bp.export_job_download", token=job.token)
+    return data
+
+
+def _submit_export(args):
+    from ..services.export_jobs import submit
+
+    flt = PaymentFilter.from_args(
+        args, current_app.config.get("TIMEZONE", "America/Bogota")
+    )
+    return flt, submit(current_app._get_current_object(), flt, _truthy(args.get("imagenes")))
+
+
+@admin_bp.get("/payments/export-excel")
+@require_admin
+def export_payments_excel():
+    """Sin JS: encola (o reutiliza) la exportación; si ya está lista, la descarga."""
+    flt, job = _submit_export(request.args)
+    if job.status == UpdateStatus.HECHO:
+        return redirect(url_for("admin_bp.export_job_download", token=job.token))
+    flash("La exportación se está generando; vuelve a hacer clic en unos segundos.", "info")
+    return redirect(url_for("admin_bp.admin", **flt.to_args()))
+
+
+@admin_bp.post("/payments/export-jobs")
+@require_admin
+def export_job_create():
+    _flt, job = _submit_export(request.values)
+    data = _export_job_json(job)
+    return jsonify(data), (200 if data["download_url"] else 202)
+
+
+@admin_bp.get("/payments/export-jobs/<token>")
+@require_admin
+def export_job_status(token):
+    from ..services.export_jobs import get_job
+
+    job = get_job(current_app, token)
+    if job is None:
+        return jsonify({"error": "exportación no encontrada"}), 404
+    return jsonify(_export_job_json(job))
+
+
+@admin_bp.get("/payments/export-jobs/<token>/download")
+@require_admin
+def export_job_download(token):
+    import os
+    from flask import send_file, abort
+    from ..services.export_jobs import get_job, result_path
+
+    job = get_job(current_app, token)
+    if job is None or job.status != UpdateStatus.HECHO:
+        abort(404)
+    path = result_path(current_app, job)
+    if not os.path.exists(path):
+        abort(404)
     return send_file(
-        bio,
+        path,
         as_attachment=True,
-        download_name=filename,
+        download_name=job.filename,
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        conditional=True,
+    )
+
+
+# --- EXPORTAR BANDEJA PLANA (CSV / JSON Lines) EN STREAMING ---
+def _flat_export_response(kind):
+    from flask import stream_with_context
+    from ..services.flat_export import iter_csv, iter_jsonl, gzip_stream
+    from ..services.excel_export import export_filename
+
+    flt = PaymentFilter.from_args(
+        request.args, current_app.config.get("TIMEZONE", "America/Bogota")
+    )
+    use_gzip = _truthy(request.args.get("gzip"))
+    chunks = iter_csv(flt) if kind == "csv" else iter_jsonl(flt)
+    mimetype = "text/csv" if kind == "csv" else "application/x-ndjson"
+    filename = export_filename(flt, False).replace(".xlsx", f".{kind}")
+    if use_gzip:
+        body = gzip_stream(chunks)
+        mimetype = "application/gzip"
+        filename += ".gz"
+    else:
+        body = (c.encode("utf-8") for c in chunks)
+    resp = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    # que el proxy no acumule la respuesta antes de enviarla
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@admin_bp.get("/payments/export.csv")
+@require_admin
+def export_payments_csv():
+    return _flat_export_response("csv")
+
+
+@admin_bp.get("/payments/export.jsonl")
+@require_admin
+def export_payments_jsonl():
+    return _flat_export_response("jsonl")
+
+
+@admin_bp.get("/payments/export-evidences.zip")
+@require_admin
+def export_evidences_zip():
+    """Evidencias de los pagos filtrados en un ZIP generado en vuelo (+ manifest.csv)."""
+    from flask import stream_with_context
+    from ..services.evidence_zip import iter_evidence_zip
+    from ..services.excel_export import export_filename
+
+    flt = PaymentFilter.from_args(
+        request.args, current_app.config.get("TIMEZONE", "America/Bogota")
     )
+    body = iter_evidence_zip(flt, current_app.config["EVID_DIR"])
+    filename = export_filename(flt, False).replace("bandeja_pagos", "evidencias").replace(".xlsx", ".zip")
+    resp = current_app.response_class(stream_with_context(body), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
@@ -1,10 +1,10 @@
 import os, re
+from functools import lru_cache
 from flask import Blueprint, request, current_app
 from ..extensions import db
 from ..models import (
     PaymentRequest,
     Evidence,
-    ConvState,
     VerifiedUser,
     ReporterWhitelist,
     Estado,
@@ -22,48 +22,41 @@ from ..services.telegram import (
     CAPTION_REGEX,
     CAPTION_KEYS,
     parse_amount,
+    prepare_keyboard,
     get_file_path,
     download_file,
+    EvidenceTooLarge,
+    begin_outbox,
+    flush_outbox,
+    discard_outbox,
 )
 from ..services.verification import (
     normalize_phone,
     send_request_contact,
     check_verification,
     get_verified,
+    invalidate_verification,
 )
+from ..services.update_queue import enqueue_update
+from ..services.idempotency import already_processed, claim_update
+from ..services.conv_state import get_store
+from ..services.thumbnails import submit_variants
+from ..services import rollup
+from ..services.normalize import search_key, prefix_filter
 
 bot_bp = Blueprint("bot_bp", __name__)
 
 
 def set_state(uid, step, data=None):
-    st = ConvState.query.filter_by(telegram_user_id=str(uid)).first()
-    if not st:
-        st = ConvState(telegram_user_id=str(uid))
-        db.session.add(st)
-    import json
-
-    st.step = step
-    st.data = json.dumps(data or {})
-    db.session.commit()
+    get_store().set(str(uid), step, data or {})
 
 
 def get_state(uid):
-    st = ConvState.query.filter_by(telegram_user_id=str(uid)).first()
-    if not st:
-        return None, {}
-    import json
-
-    try:
-        return st.step, json.loads(st.data or "{}")
-    except Exception:
-        return st.step, {}
+    return get_store().get(str(uid))
 
 
 def clear_state(uid):
-    st = ConvState.query.filter_by(telegram_user_id=str(uid)).first()
-    if st:
-        db.session.delete(st)
-        db.session.commit()
+    get_store().clear(str(uid))
 
 
 # Calendario inline
@@ -72,14 +65,31 @@ def _spanish_month(m):
     return names[m-1] if 1 <= m <= 12 else str(m)
 
 
-def _build_calendar_kb(year, month):
+def local_today():
+    """Fecha de hoy en Config.TIMEZONE (no en la hora del servidor)."""
+    import datetime as _dt
+    from zoneinfo import ZoneInfo
+
+    try:
+        tz = ZoneInfo(current_app.config.get("TIMEZONE", "America/Bogota"))
+    except Exception:
+        tz = _dt.timezone.utc
+    return _dt.datetime.now(tz).date()
+
+
+def _build_calendar_kb(year, month, today=None):
+    """Teclado del mes (serializado y cacheado por (año, mes, hoy))."""
+    return _calendar_kb_cached(year, month, today or local_today())
+
+
+@lru_cache(maxsize=64)
+def _calendar_kb_cached(year, month, today):
     import calendar, datetime as _dt
     y, m = year, month
     cal = calendar.Calendar(firstweekday=0)
     weeks = cal.monthdayscalendar(y, m)
     title = f"{_spanish_month(m)} {y}"
     rows = []
-    today = _dt.date.today()
     next_cb = "CAL_NOP" if (y, m) >= (today.year, today.month) else f"CAL_NAV:{y}-{m:02d}:next"
     rows.append([
         {"text": "◀", "callback_data": f"CAL_NAV:{y}-{m:02d}:prev"},
@@ -110,12 +120,54 @@ def _build_calendar_kb(year, month):
         {"text": "Hoy", "callback_data": "CAL_TODAY"},
         {"text": "Cancelar", "callback_data": "CAL_CANCEL"},
     ])
-    return {"inline_keyboard": rows}, title
+    return prepare_keyboard({"inline_keyboard": rows}), title
 
 
 @bot_bp.post("/telegram/webhook")
 def telegram_webhook():
     update = request.get_json(silent=True) or {}
+    # Modo cola: solo persistimos el update y respondemos; lo procesa `bot-worker`
+    if current_app.config.get("WEBHOOK_QUEUE"):
+        enqueue_update(update)
+        return {"ok": True}
+    return handle_update(update)
+
+
+def handle_update(update):
+    """
+    Procesa un update de Telegram (webhook inline o worker de la cola) como
+    una sola unidad de trabajo: ledger, estado, verificación y pago se
+    confirman en un único commit, y los mensajes a Telegram salen solo
+    después de que ese commit tuvo éxito.
+    """
+    store = get_store()
+    begin_outbox()
+    try:
+        # Reentregas de Telegram y ediciones de un mensaje ya procesado: no-op
+        if already_processed(update):
+            discard_outbox()
+            return {"ok": True}
+        result = _process_update(update)
+        # El ledger se escribe al final: la descarga de evidencias no corre
+        # dentro de una transacción de escritura. Si otra entrega concurrente
+        # ya lo registró, se descarta todo lo de esta.
+        if not claim_update(update):
+            store.discard()
+            discard_outbox()
+            return {"ok": True}
+        # write-behind: una sola escritura de conv_state por update
+        store.flush()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        store.discard()
+        discard_outbox()
+        raise
+    flush_outbox()
+    return result
+
+
+def _process_update(update):
     cb = update.get("callback_query")
     if cb:
         chat_id = (cb.get("message") or {}).get("chat", {}).get("id")
@@ -139,7 +191,7 @@ def telegram_webhook():
                 answer_callback_query(cb_id, "Cancelado")
                 return {"ok": True}
             if data_cb == "CAL_TODAY":
-                day = _dt.date.today().isoformat()
+                day = local_today().isoformat()
                 data_cb = f"CAL_SET:{day}"
             if data_cb.startswith("CAL_NAV:"):
                 try:
@@ -160,10 +212,10 @@ def telegram_webhook():
                     answer_callback_query(cb_id)
                     return {"ok": True}
                 # Clamp navigation so it never goes beyond current month
-                today = _dt.date.today()
+                today = local_today()
                 if (y, m) > (today.year, today.month):
                     y, m = today.year, today.month
-                kb, _ = _build_calendar_kb(y, m)
+                kb, _ = _build_calendar_kb(y, m, today)
                 try:
                     edit_message_reply_markup(chat_id, message_id, kb)
                 except Exception:
@@ -185,12 +237,11 @@ def telegram_webhook():
                         return {"ok": True}
                     try:
                         selected = _dt.date.fromisoformat(day)
-                        today = _dt.date.today()
+                        today = local_today()
                         if selected > today:
                             answer_callback_query(cb_id, "Fecha futura no permitida")
                             return {"ok": True}
                         p.fecha_consignacion = selected
-                        db.session.commit()
                         disp = selected.strftime("%d/%m/%Y")
                         try:
                             edit_message_text(chat_id, message_id, f"✅ Fecha seleccionada: <b>{disp}</b>")
@@ -249,7 +300,7 @@ def telegram_webhook():
             vu.phone_e164 = phone
             vu.sucursal = wl.sucursal
             vu.verified_at = datetime.datetime.utcnow()
-        db.session.commit()
+        invalidate_verification(telegram_user_id=from_user)
         txt = f"✅ Número verificado: <b>{phone}</b>"
         if wl.sucursal:
             txt += f"\n🏬 Sucursal asignada: <b>{wl.sucursal}</b>"
@@ -301,7 +352,7 @@ def telegram_webhook():
             vu = VerifiedUser.query.filter_by(telegram_user_id=str(from_user)).first()
             if vu:
                 db.session.delete(vu)
-                db.session.commit()
+            invalidate_verification(telegram_user_id=from_user)
             send_request_contact(
                 chat_id, "🔒 Sesión cerrada. Comparte tu <b>número</b> para continuar."
             )
@@ -339,9 +390,8 @@ def telegram_webhook():
 
             if step == "ASK_FECHA_CONSIG":
                 # No aceptamos texto: mostramos calendario inline
-                import datetime as _dt
-                today = _dt.date.today()
-                kb, title = _build_calendar_kb(today.year, today.month)
+                today = local_today()
+                kb, title = _build_calendar_kb(today.year, today.month, today)
                 send_message(chat_id, f"🗓️ Selecciona la <b>fecha de consignación</b> (usa el calendario).", kb=kb)
                 return {"ok": True}
 
@@ -430,13 +480,20 @@ def telegram_webhook():
 
             if step == "ASK_CLIENTE_STATUS":
                 cliente = text
+                key = search_key(cliente)
+                # sin tildes/mayúsculas y por prefijo; el nombre exacto tiene prioridad
                 pr = (
                     PaymentRequest.query.filter(
                         PaymentRequest.telegram_user_id == str(from_user),
-                        PaymentRequest.cliente == cliente,
+                        prefix_filter(PaymentRequest.cliente_key, key, db.engine.dialect.name),
+                    )
+                    .order_by(
+                        (PaymentRequest.cliente_key == key).desc(),
+                        PaymentRequest.created_at.desc(),
                     )
-                    .order_by(PaymentRequest.created_at.desc())
                     .first()
+                    if key
+                    else None
                 )
                 if not pr:
                     send_message(
@@ -510,15 +567,8 @@ def telegram_webhook():
         return {"ok": True}
     if getattr(vu, "sucursal", None):
         parsed["sucursal"] = vu.sucursal
-    # Obtener sociedad desde whitelist del número verificado
-    sociedad_val = None
-    try:
-        if getattr(vu, "phone_e164", None):
-            wl_row = ReporterWhitelist.query.filter_by(phone_e164=vu.phone_e164).first()
-            if wl_row and getattr(wl_row, "sociedad", None):
-                sociedad_val = wl_row.sociedad
-    except Exception:
-        sociedad_val = None
+    # Sociedad desde la whitelist del número verificado (ya resuelta en la verificación)
+    sociedad_val = getattr(vu, "sociedad", None)
 
     # archivo
     file_id, tipo = None, None
@@ -526,9 +576,11 @@ def telegram_webhook():
     if photos:
         best = sorted(photos, key=lambda p: p.get("file_size", 0))[-1]
         file_id, tipo = best["file_id"], "photo"
+        file_unique_id = best.get("file_unique_id")
         file_size = int(best.get("file_size", 0) or 0)
     else:
         file_id, tipo = document["file_id"], "document"
+        file_unique_id = (document or {}).get("file_unique_id")
         file_size = int((document or {}).get("file_size", 0) or 0)
 
     # Validación de tamaño máximo
@@ -558,9 +610,38 @@ def telegram_webhook():
             )
             return {"ok": True}
 
+    # Mismo archivo ya recibido antes: reutilizamos lo almacenado sin descargar
+    known = None
+    if file_unique_id:
+        known = (
+            Evidence.query.filter(
+                Evidence.file_unique_id == file_unique_id,
+                Evidence.sha256.isnot(None),
+            )
+            .order_by(Evidence.id.desc())
+            .first()
+        )
+        if known and not os.path.exists(
+            os.path.join(current_app.config["EVID_DIR"], known.filename or "")
+        ):
+            known = None
     try:
-        file_path = get_file_path(file_id)
-        filename = download_file(file_path)
+        if known:
+            filename, sha256, size_bytes = known.filename, known.sha256, known.size_bytes
+        else:
+            file_path = get_file_path(file_id)
+            filename, sha256, size_bytes = download_file(file_path, max_bytes=max_bytes)
+            # Miniaturas en el pool de procesos (no bloquea el update)
+            try:
+                submit_variants(current_app._get_current_object(), filename)
+            except Exception as e:
+                current_app.logger.error(f"No se pudieron encolar miniaturas: {e}")
+    except EvidenceTooLarge:
+        send_message(
+            chat_id,
+            f"⚠️ El archivo es muy grande (>{max_mb} MB). Envía una imagen o documento más liviano.",
+        )
+        return {"ok": True}
     except Exception:
         send_message(chat_id, "⚠️ Error descargando la evidencia. Intenta de nuevo.")
         return {"ok": True}
@@ -582,18 +663,23 @@ def telegram_webhook():
     )
     db.session.add(p)
     db.session.flush()
+    rollup.record_created(p)
     db.session.add(
         Evidence(
-            payment_id=p.id, telegram_file_id=file_id, filename=filename, tipo=tipo
+            payment_id=p.id,
+            telegram_file_id=file_id,
+            file_unique_id=file_unique_id,
+            filename=filename,
+            tipo=tipo,
+            sha256=sha256,
+            size_bytes=size_bytes,
         )
     )
-    db.session.commit()
 
     # Solicitar fecha de consignación con calendario inline
     set_state(from_user, "ASK_FECHA_CONSIG", {"pid": p.id})
-    import datetime as _dt
-    today = _dt.date.today()
-    kb, _ = _build_calendar_kb(today.year, today.month)
+    today = local_today()
+    kb, _ = _build_calendar_kb(today.year, today.month, today)
     send_message(
         chat_id,
         f"✅ Comprobante recibido. ID solicitud: <b>{p.id}</b>\n🗓️ Selecciona la <b>fecha de consignación</b> en el calendario.",
@@ -4,7 +4,7 @@ from sqlalchemy import or_
 from ..extensions import db
 from ..models import ReporterWhitelist, VerifiedUser, ConvState, Sociedad
 from .admin_bp import require_admin
-from ..services.verification import normalize_phone
+from ..services.verification import normalize_phone, invalidate_verification
 
 whitelist_bp = Blueprint("whitelist_bp", __name__, url_prefix="")
 
@@ -91,6 +91,7 @@ def whitelist_create():
         )
         msg = f"Creado: {phone}"
     db.session.commit()
+    invalidate_verification(phone=phone)
     flash(msg, "success")
     return redirect(url_for("whitelist_bp.whitelist"))
 
@@ -109,6 +110,7 @@ def whitelist_update(rid):
     if exists:
         flash("Ese número ya existe.", "danger")
         return redirect(url_for("whitelist_bp.whitelist"))
+    old_phone = wl.phone_e164
     wl.phone_e164 = phone
     wl.sucursal = (request.form.get("sucursal") or "").strip()
     wl.ciudad = (request.form.get("ciudad") or "").strip()
@@ -117,6 +119,8 @@ def whitelist_update(rid):
     wl.nombre = (request.form.get("nombre") or "").strip()
     wl.enabled = request.form.get("enabled") == "on"
     db.session.commit()
+    invalidate_verification(phone=old_phone)
+    invalidate_verification(phone=phone)
     flash("Registro actualizado.", "success")
     return redirect(url_for("whitelist_bp.whitelist"))
 
@@ -127,6 +131,7 @@ def whitelist_toggle(rid):
     wl = ReporterWhitelist.query.get_or_404(rid)
     wl.enabled = not wl.enabled
     db.session.commit()
+    invalidate_verification(phone=wl.phone_e164)
     flash(
         ("Activado" if wl.enabled else "Desactivado") + f": {wl.phone_e164}", "success"
     )
@@ -139,6 +144,7 @@ def whitelist_delete(rid):
     wl = ReporterWhitelist.query.get_or_404(rid)
     db.session.delete(wl)
     db.session.commit()
+    invalidate_verification(phone=wl.phone_e164)
     flash(f"Eliminado: {wl.phone_e164}", "success")
     return redirect(url_for("whitelist_bp.whitelist"))
 
@@ -189,6 +195,7 @@ def whitelist_import():
                 )
                 new += 1
         db.session.commit()
+        invalidate_verification()
         flash(f"Importación OK. Nuevos: {new}, Actualizados: {upd}.", "success")
     except Exception as e:
         db.session.rollback()
@@ -234,6 +241,7 @@ def whitelist_revoke(rid):
         synchronize_session=False
     )
     db.session.commit()
+    invalidate_verification(phone=phone)
     flash(f"Sesiones revocadas para {phone}: {count}", "success")
     return redirect(url_for("whitelist_bp.whitelist"))
 
@@ -243,5 +251,6 @@ def whitelist_revoke(rid):
 def whitelist_revoke_all():
     count = VerifiedUser.query.delete(synchronize_session=False)
     db.session.commit()
+    invalidate_verification()
     flash(f"Todas las sesiones revocadas: {count}", "success")
     return redirect(url_for("whitelist_bp.whitelist"))
@@ -5,7 +5,7 @@ import datetime
 import click
 from sqlalchemy import text
 from .extensions import db
-import requests
+from .services.telegram import get_client
 
 
 def register_cli(app):
@@ -88,7 +88,7 @@ def register_cli(app):
             click.echo("❗ Define PUBLIC_BASE_URL en .env o usa --url")
             return
         webhook_url = f"{base}/telegram/webhook"
-        r = requests.post(f"{app.config['BOT_API']}/setWebhook", data={"url": webhook_url}, timeout=15)
+        r = get_client(app).request("setWebhook", data={"url": webhook_url})
         ok = False
         try:
             ok = r.ok and r.json().get("ok")
@@ -99,7 +99,7 @@ def register_cli(app):
     @app.cli.command("delete-webhook")
     def delete_webhook():
         """Elimina el webhook configurado en Telegram."""
-        r = requests.post(f"{app.config['BOT_API']}/deleteWebhook", timeout=15)
+        r = get_client(app).request("deleteWebhook")
         ok = False
         try:
             ok = r.ok and r.json().get("ok")
@@ -110,7 +110,7 @@ def register_cli(app):
     @app.cli.command("get-webhook")
     def get_webhook():
         """Muestra información del webhook actual en Telegram."""
-        r = requests.get(f"{app.config['BOT_API']}/getWebhookInfo", timeout=15)
+        r = get_client(app).request("getWebhookInfo", http_method="GET")
         try:
             click.echo(r.json())
         except Exception:
@@ -131,4 +131,175 @@ def register_cli(app):
             .delete(synchronize_session=False)
         )
         db.session.commit()
+        from .services.verification import invalidate_verification
+
+        invalidate_verification()
         click.echo(f"Sesiones expiradas revocadas: {count}")
+
+    @app.cli.command("bot-worker")
+    @click.option("--concurrency", default=4, show_default=True, help="Hilos procesando la cola.")
+    @click.option("--poll-interval", default=0.5, show_default=True, help="Espera (s) cuando la cola está vacía.")
+    def bot_worker(concurrency, poll_interval):
+        """Drena la cola de updates (WEBHOOK_QUEUE=true) respetando el orden por usuario."""
+        from .services.update_queue import run_workers
+        from .blueprints.bot_bp import handle_update
+
+        click.echo(f"bot-worker iniciado (concurrency={concurrency}). Ctrl+C para salir.")
+        run_workers(app, handle_update, concurrency=concurrency, poll_interval=poll_interval)
+
+    @app.cli.command("bot-queue-stats")
+    def bot_queue_stats():
+        """Muestra profundidad y lag de la cola de updates."""
+        from .services.update_queue import queue_stats
+
+        click.echo(queue_stats())
+
+    @app.cli.command("purge-processed-updates")
+    def purge_processed_updates():
+        """Limpia el ledger de updates procesados según PROCESSED_UPDATES_TTL_HOURS."""
+        from .services.idempotency import purge_processed
+
+        click.echo(f"Updates procesados eliminados: {purge_processed()}")
+
+    @app.cli.command("purge-exports")
+    def purge_exports():
+        """Borra exportaciones (trabajos y archivos) según EXPORT_RETENTION_HOURS."""
+        from .services.export_jobs import purge_exports as _purge
+
+        jobs, files = _purge(app)
+        click.echo(f"Exportaciones eliminadas: {jobs} trabajos, {files} archivos.")
+
+    @app.cli.command("poll")
+    @click.option("--limit", default=100, show_default=True, help="Updates por llamada a getUpdates (1-100).")
+    @click.option("--timeout", default=30, show_default=True, help="Segundos de long polling.")
+    @click.option("--concurrency", default=4, show_default=True, help="Usuarios procesados en paralelo.")
+    @click.option("--keep-webhook", is_flag=True, help="No eliminar el webhook antes de iniciar.")
+    def poll(limit, timeout, concurrency, keep_webhook):
+        """Recibe updates con getUpdates (long polling), sin webhook ni túnel."""
+        from .services.polling import run_polling
+        from .blueprints.bot_bp import handle_update
+
+        if not keep_webhook:
+            # getUpdates no funciona mientras haya un webhook configurado
+            get_client(app).request("deleteWebhook")
+        click.echo(f"Polling iniciado (limit={limit}, concurrency={concurrency}). Ctrl+C para salir.")
+        try:
+            run_polling(app, handle_update, limit=min(max(limit, 1), 100), timeout=timeout, concurrency=concurrency)
+        except KeyboardInterrupt:
+            click.echo("Polling detenido.")
+
+    @app.cli.command("thumbs-backfill")
+    @click.option("--force", is_flag=True, help="Regenerar aunque ya existan.")
+    def thumbs_backfill(force):
+        """Genera miniaturas (thumb/medium) para evidencias existentes."""
+        from .models import Evidence
+        from .services.thumbnails import submit_variants
+
+        names = [
+            n for (n,) in db.session.query(Evidence.filename).distinct() if n
+        ]
+        futures = [f for f in (submit_variants(app, n, force=force) for n in names) if f]
+        done, errors = 0, 0
+        for f in futures:
+            try:
+                f.result()
+                done += 1
+            except Exception:
+                errors += 1
+        click.echo(f"Miniaturas: {done} imágenes procesadas, {errors} errores.")
+
+    @app.cli.command("rollup-rebuild")
+    def rollup_rebuild():
+        """Recalcula payment_rollup_daily desde payment_request (backfill/reparación)."""
+        from .services.rollup import rebuild
+
+        click.echo(f"Rollup diario reconstruido: {rebuild()} filas.")
+
+    @app.cli.command("explain-queries")
+    @click.option("--sql", "show_sql", is_flag=True, help="Mostrar también el SQL.")
+    def explain_queries(show_sql):
+        """Muestra el plan (EXPLAIN) de las consultas calientes para verificar los índices."""
+        from .services.query_plans import canonical_queries, explain
+
+        for name, query in canonical_queries():
+            sql, plan = explain(query)
+            click.echo(f"== {name}")
+            if show_sql:
+                click.echo(sql)
+            for line in plan:
+                click.echo(f"   {line}")
+
+    @app.cli.command("cliente-key-backfill")
+    @click.option("--batch", default=1000, show_default=True, help="Filas por lote (un commit por lote).")
+    def cliente_key_backfill(batch):
+        """Completa payment_request.cliente_key en filas anteriores a la columna."""
+        from .models import PaymentRequest
+        from .services.normalize import search_key
+
+        last_id, total = 0, 0
+        while True:
+            rows = (
+                db.session.query(PaymentRequest.id, PaymentRequest.cliente)
+                .filter(PaymentRequest.id > last_id, PaymentRequest.cliente_key.is_(None))
+                .order_by(PaymentRequest.id)
+                .limit(batch)
+                .all()
+            )
+            if not rows:
+                break
+            db.session.bulk_update_mappings(
+                PaymentRequest,
+                [{"id": pid, "cliente_key": search_key(cliente) or ""} for pid, cliente in rows],
+            )
+            db.session.commit()
+            last_id = rows[-1][0]
+            total += len(rows)
+            click.echo(f"  … {total} filas")
+        click.echo(f"cliente_key completado en {total} filas.")
+
+    @app.cli.command("evidence-hash-backfill")
+    @click.option("--batch", default=500, show_default=True, help="Evidencias por lote (un commit por lote).")
+    def evidence_hash_backfill(batch):
+        """Calcula sha256/size_bytes de evidencias anteriores a esas columnas."""
+        import hashlib
+        from werkzeug.security import safe_join
+        from .models import Evidence
+
+        evid_dir = app.config["EVID_DIR"]
+        last_id, total, missing = 0, 0, 0
+        while True:
+            rows = (
+                db.session.query(Evidence.id, Evidence.filename)
+                .filter(Evidence.id > last_id, Evidence.sha256.is_(None))
+                .order_by(Evidence.id)
+                .limit(batch)
+                .all()
+            )
+            # la lectura se cierra antes de leer los archivos
+            db.session.rollback()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            hashed, updates = {}, []
+            for eid, filename in rows:
+                if filename not in hashed:
+                    path = safe_join(evid_dir, filename) if filename else None
+                    hashed[filename] = None
+                    if path and os.path.isfile(path):
+                        digest, size = hashlib.sha256(), 0
+                        with open(path, "rb") as f:
+                            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                                digest.update(chunk)
+                                size += len(chunk)
+                        hashed[filename] = (digest.hexdigest(), size)
+                if hashed[filename] is None:
+                    missing += 1
+                    continue
+                sha256, size = hashed[filename]
+                updates.append({"id": eid, "sha256": sha256, "size_bytes": size})
+            if updates:
+                db.session.bulk_update_mappings(Evidence, updates)
+                db.session.commit()
+            total += len(updates)
+            click.echo(f"  … {total} evidencias")
+        click.echo(f"sha256 completado en {total} evidencias ({missing} sin archivo).")
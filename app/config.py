@@ -60,15 +60,54 @@ class Config:
     # Paths
     BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
     EVID_DIR = os.path.join(BASE_DIR, "evidencias")
+    EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(BASE_DIR, "exports"))
 
     # Telegram API
     BOT_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
     FILE_API = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}"
+    # Conexiones keep-alive máximas hacia Telegram por proceso/worker
+    TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "10"))
 
     # TTL verificación (minutos). 0 = nunca expira
     VERIF_TTL_MINUTES = int(os.getenv("VERIFICATION_TTL_MINUTES", "480"))
+    # Caché en proceso del resultado de verificación (segundos). 0 = sin caché
+    VERIF_CACHE_SECONDS = int(os.getenv("VERIF_CACHE_SECONDS", "60"))
     # Tamaño máximo de evidencia (MB)
     EVID_MAX_MB = int(os.getenv("EVID_MAX_MB", "10"))
+    # Miniaturas de evidencias (webp | jpeg) generadas al recibirlas
+    THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp").lower()
+    THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+    THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+    # Búsqueda de la bandeja: auto (FTS5/FULLTEXT/pg_trgm si la migración lo creó) | like
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+    # Cómo se entregan las evidencias: python | x-accel (nginx) | x-sendfile (apache/lighttpd)
+    EVID_SERVE_MODE = os.getenv("EVID_SERVE_MODE", "python").lower()
+    EVID_ACCEL_PREFIX = os.getenv("EVID_ACCEL_PREFIX", "/_evidencias/")
+    # Exportaciones a Excel en segundo plano (por proceso): hilos y cupo para "con imágenes"
+    EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+    EXPORT_IMAGE_SLOTS = int(os.getenv("EXPORT_IMAGE_SLOTS", "1"))
+    EXPORT_JOB_TIMEOUT_SECONDS = int(os.getenv("EXPORT_JOB_TIMEOUT_SECONDS", "1800"))
+    EXPORT_RETENTION_HOURS = int(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+    # Imágenes del Excel "con imágenes": lado máximo (px) y calidad JPEG al recomprimir
+    EXPORT_IMAGE_MAX_W = int(os.getenv("EXPORT_IMAGE_MAX_W", "420"))
+    EXPORT_IMAGE_MAX_H = int(os.getenv("EXPORT_IMAGE_MAX_H", "300"))
+    EXPORT_IMAGE_QUALITY = int(os.getenv("EXPORT_IMAGE_QUALITY", "70"))
+
+    # Cola de updates entrantes: el webhook solo encola y `bot-worker` procesa
+    WEBHOOK_QUEUE = os.getenv("WEBHOOK_QUEUE", "false").lower() == "true"
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+    QUEUE_LOCK_TIMEOUT_SECONDS = int(os.getenv("QUEUE_LOCK_TIMEOUT_SECONDS", "300"))
+    QUEUE_RETENTION_HOURS = int(os.getenv("QUEUE_RETENTION_HOURS", "72"))
+    # Ledger de updates procesados (idempotencia)
+    PROCESSED_UPDATES_TTL_HOURS = int(os.getenv("PROCESSED_UPDATES_TTL_HOURS", "72"))
+
+    # Estado de conversación del bot: memory (LRU en proceso) | db | redis
+    CONV_STATE_BACKEND = os.getenv("CONV_STATE_BACKEND", "memory").lower()
+    # memory: "behind" = una escritura por update al final; "through" = inmediata
+    CONV_STATE_WRITE = os.getenv("CONV_STATE_WRITE", "behind").lower()
+    CONV_STATE_TTL_SECONDS = int(os.getenv("CONV_STATE_TTL_SECONDS", "3600"))
+    CONV_STATE_MAX_ENTRIES = int(os.getenv("CONV_STATE_MAX_ENTRIES", "5000"))
+    REDIS_URL = os.getenv("REDIS_URL", "").strip()
 
     # Dev tunnel
     DEV_TUNNEL = os.getenv("DEV_TUNNEL", "false").lower() == "true"
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from .services.telegram import TelegramClient
 
 db = SQLAlchemy()
 migrate = Migrate()
+telegram = TelegramClient()
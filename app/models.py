@@ -1,7 +1,9 @@
 import datetime
 from enum import Enum
 from sqlalchemy import Enum as SAEnum
+from sqlalchemy.orm import validates
 from .extensions import db
+from .services.normalize import search_key
 
 
 class Estado(str, Enum):
@@ -16,6 +18,13 @@ class Sociedad(str, Enum):
     ALMACENES = "ALMACENES"
 
 
+class UpdateStatus(str, Enum):
+    PENDIENTE = "PENDIENTE"
+    PROCESANDO = "PROCESANDO"
+    HECHO = "HECHO"
+    ERROR = "ERROR"
+
+
 class PaymentRequest(db.Model):
     __tablename__ = "payment_request"
     id = db.Column(db.Integer, primary_key=True)
@@ -25,9 +34,11 @@ class PaymentRequest(db.Model):
     medio_pago = db.Column(db.String(80), index=True)
     # referencia: aquí guardamos el NOMBRE DEL CLIENTE (compatibilidad)
     cliente = db.Column(db.String(120), index=True)
+    # cliente normalizado (sin tildes/mayúsculas/espacios extra) para búsquedas
+    cliente_key = db.Column(db.String(120))
     valor = db.Column(db.Integer, index=True)
     # fecha de consignación reportada por el usuario
-    fecha_consignacion = db.Column(db.Date)
+    fecha_consignacion = db.Column(db.Date, index=True)
     sociedad = db.Column(SAEnum(Sociedad), index=True)
     estado = db.Column(SAEnum(Estado), default=Estado.PENDIENTE, nullable=False, index=True)
     motivo_rechazo = db.Column(db.Text)
@@ -39,6 +50,37 @@ class PaymentRequest(db.Model):
         "Evidence", backref="payment", lazy=True, cascade="all, delete-orphan"
     )
 
+    # Índices por ruta de acceso real (bandeja, filtros, "Ver estado" del bot)
+    __table_args__ = (
+        db.Index("ix_payment_request_created_id", "created_at", "id"),
+        db.Index("ix_payment_request_estado_created", "estado", "created_at", "id"),
+        db.Index("ix_payment_request_sociedad_created", "sociedad", "created_at", "id"),
+        db.Index(
+            "ix_payment_request_cliente_key",
+            "cliente_key",
+            postgresql_ops={"cliente_key": "varchar_pattern_ops"},
+        ),
+        db.Index(
+            "ix_payment_request_user_cliente_key",
+            "telegram_user_id",
+            "cliente_key",
+            postgresql_ops={"cliente_key": "varchar_pattern_ops"},
+        ),
+        # cola de revisión: solo pendientes (parcial en Postgres/SQLite; MySQL no lo soporta)
+        db.Index(
+            "ix_payment_request_pendiente",
+            "created_at",
+            "id",
+            postgresql_where=db.text("estado = 'PENDIENTE'"),
+            sqlite_where=db.text("estado = 'PENDIENTE'"),
+        ),
+    )
+
+    @validates("cliente")
+    def _sync_cliente_key(self, _key, value):
+        self.cliente_key = search_key(value)
+        return value
+
 
 class Evidence(db.Model):
     __tablename__ = "evidence"
@@ -47,8 +89,12 @@ class Evidence(db.Model):
         db.Integer, db.ForeignKey("payment_request.id"), nullable=False, index=True
     )
     telegram_file_id = db.Column(db.String(200))
+    # file_unique_id es estable entre reenvíos del mismo archivo en Telegram
+    file_unique_id = db.Column(db.String(100), index=True)
     filename = db.Column(db.String(200))
     tipo = db.Column(db.String(30))
+    sha256 = db.Column(db.String(64), index=True)
+    size_bytes = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
 
@@ -83,3 +129,97 @@ class VerifiedUser(db.Model):
     verified_at = db.Column(
         db.DateTime, default=datetime.datetime.utcnow, nullable=False
     )
+
+
+class InboundUpdate(db.Model):
+    """Update crudo de Telegram en cola (modo WEBHOOK_QUEUE)."""
+
+    __tablename__ = "inbound_update"
+    id = db.Column(db.Integer, primary_key=True)
+    update_id = db.Column(db.BigInteger, index=True)
+    # clave de orden: los updates de un mismo usuario se procesan en secuencia
+    telegram_user_id = db.Column(db.String(50))
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(
+        SAEnum(UpdateStatus), default=UpdateStatus.PENDIENTE, nullable=False
+    )
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    available_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_inbound_update_status_id", "status", "id"),
+        db.Index("ix_inbound_update_user_status", "telegram_user_id", "status", "id"),
+    )
+
+
+class ProcessedUpdate(db.Model):
+    """Ledger de updates ya procesados (idempotencia ante reenvíos de Telegram)."""
+
+    __tablename__ = "processed_update"
+    id = db.Column(db.Integer, primary_key=True)
+    # "u:<update_id>" o "m:<chat_id>:<message_id>" (ediciones del mismo mensaje)
+    update_key = db.Column(db.String(80), unique=True, index=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+class BotCursor(db.Model):
+    """Posición durable de lectura (p.ej. offset de getUpdates en modo poll)."""
+
+    __tablename__ = "bot_cursor"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(40), unique=True, index=True, nullable=False)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
+    )
+
+
+class PaymentRollupDaily(db.Model):
+    """
+    Agregado diario (día local) de payment_request, mantenido de forma
+    incremental en la misma transacción que crea o cambia de estado un pago.
+    Las dimensiones vacías se guardan como "" para que la clave única aplique.
+    """
+
+    __tablename__ = "payment_rollup_daily"
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    sucursal = db.Column(db.String(120), nullable=False, default="")
+    sociedad = db.Column(db.String(20), nullable=False, default="")
+    estado = db.Column(SAEnum(Estado), nullable=False)
+    medio_pago = db.Column(db.String(80), nullable=False, default="")
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "day", "sucursal", "sociedad", "estado", "medio_pago", name="uq_rollup_daily_key"
+        ),
+    )
+
+
+class ExportJob(db.Model):
+    """Exportación de la bandeja en segundo plano; el archivo queda en EXPORT_DIR."""
+
+    __tablename__ = "export_job"
+    id = db.Column(db.Integer, primary_key=True)
+    # id público (no secuencial) para consultar progreso y descargar
+    token = db.Column(db.String(32), unique=True, index=True, nullable=False)
+    # filtros normalizados + versión de los datos: mismo key -> mismo archivo
+    cache_key = db.Column(db.String(64), index=True, nullable=False)
+    params = db.Column(db.Text, nullable=False)
+    include_images = db.Column(db.Boolean, default=False, nullable=False)
+    status = db.Column(
+        SAEnum(UpdateStatus, name="exportstatus"), default=UpdateStatus.PENDIENTE, nullable=False
+    )
+    progress = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer)
+    filename = db.Column(db.String(200))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,242 @@
+import json, time, datetime, threading
+from collections import OrderedDict
+from flask import current_app, g
+from sqlalchemy.exc import IntegrityError
+from ..extensions import db
+from ..models import ConvState
+
+
+# --- Persistencia en conv_state (sin SELECT previo: UPDATE y, si no existe, INSERT) ---
+def _db_read(uid):
+    st = ConvState.query.filter_by(telegram_user_id=uid).first()
+    if not st:
+        return None, {}
+    try:
+        return st.step, json.loads(st.data or "{}")
+    except Exception:
+        return st.step, {}
+
+
+def _db_write(uid, step, data):
+    values = {
+        ConvState.step: step,
+        ConvState.data: json.dumps(data or {}),
+        ConvState.updated_at: datetime.datetime.utcnow(),
+    }
+    n = ConvState.query.filter_by(telegram_user_id=uid).update(
+        values, synchronize_session=False
+    )
+    if not n:
+        try:
+            with db.session.begin_nested():
+                db.session.add(
+                    ConvState(telegram_user_id=uid, step=step, data=json.dumps(data or {}))
+                )
+        except IntegrityError:
+            # otro proceso insertó la fila entre el UPDATE y el INSERT
+            ConvState.query.filter_by(telegram_user_id=uid).update(
+                values, synchronize_session=False
+            )
+
+
+def _db_delete(uid):
+    ConvState.query.filter_by(telegram_user_id=uid).delete(synchronize_session=False)
+
+
+class DbStateStore:
+    """
+    Sin caché: cada operación va directo a conv_state. Ningún backend hace
+    commit: las escrituras se confirman con la unidad de trabajo del update.
+    """
+
+    def get(self, uid):
+        return _db_read(uid)
+
+    def set(self, uid, step, data):
+        _db_write(uid, step, data)
+
+    def clear(self, uid):
+        _db_delete(uid)
+
+    def flush(self):
+        pass
+
+    def discard(self):
+        pass
+
+
+class MemoryStateStore:
+    """
+    LRU en proceso con TTL delante de conv_state. Las lecturas se sirven de
+    memoria (también la ausencia de estado); las escrituras van a la BD de
+    inmediato ("through") o se acumulan por update y se escriben una sola
+    vez al final ("behind", vía flush()).
+    Solo es coherente si todos los updates de un usuario los atiende el mismo
+    proceso (un servidor, o `bot-worker`); con varios workers web usar "db" o
+    "redis".
+    """
+
+    def __init__(self, max_entries=5000, ttl_seconds=3600, write_mode="behind"):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.write_behind = write_mode == "behind"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, uid):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if not entry:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[uid]
+                return None
+            self._entries.move_to_end(uid)
+            return entry
+
+    def _cache_put(self, uid, step, data):
+        with self._lock:
+            self._entries[uid] = (step, dict(data or {}), time.monotonic() + self.ttl)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cache_drop(self, uid):
+        with self._lock:
+            self._entries.pop(uid, None)
+
+    def _pending(self):
+        if "_conv_state_pending" not in g:
+            g._conv_state_pending = {}
+        return g._conv_state_pending
+
+    def get(self, uid):
+        entry = self._cache_get(uid)
+        if entry is None:
+            step, data = _db_read(uid)
+            self._cache_put(uid, step, data)
+            return step, dict(data)
+        return entry[0], dict(entry[1])
+
+    def _touch(self, uid):
+        if "_conv_state_touched" not in g:
+            g._conv_state_touched = set()
+        g._conv_state_touched.add(uid)
+
+    def set(self, uid, step, data):
+        self._cache_put(uid, step, data)
+        self._touch(uid)
+        if self.write_behind:
+            self._pending()[uid] = (step, dict(data or {}))
+        else:
+            _db_write(uid, step, data)
+
+    def clear(self, uid):
+        self._cache_put(uid, None, {})
+        self._touch(uid)
+        if self.write_behind:
+            self._pending()[uid] = None
+        else:
+            _db_delete(uid)
+
+    def flush(self):
+        """Escribe (sin commit) el estado final de cada usuario tocado en este update."""
+        g.pop("_conv_state_touched", None)
+        pending = g.pop("_conv_state_pending", None)
+        if not pending:
+            return
+        for uid, value in pending.items():
+            if value is None:
+                _db_delete(uid)
+            else:
+                _db_write(uid, value[0], value[1])
+
+    def discard(self):
+        """El update falló (rollback): olvidamos lo cacheado para releer desde la BD."""
+        g.pop("_conv_state_pending", None)
+        for uid in g.pop("_conv_state_touched", None) or ():
+            self._cache_drop(uid)
+
+
+class RedisStateStore:
+    """Backend compartido entre procesos (CONV_STATE_BACKEND=redis)."""
+
+    def __init__(self, url, ttl_seconds=3600):
+        try:
+            import redis  # type: ignore
+        except ModuleNotFoundError:
+            raise RuntimeError("Falta redis: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl_seconds
+
+    def _key(self, uid):
+        return f"conv_state:{uid}"
+
+    def _read(self, uid):
+        raw = self.client.get(self._key(uid))
+        if not raw:
+            return None, {}
+        try:
+            obj = json.loads(raw)
+            return obj.get("step"), obj.get("data") or {}
+        except Exception:
+            return None, {}
+
+    def _pending(self):
+        if "_conv_state_pending" not in g:
+            g._conv_state_pending = {}
+        return g._conv_state_pending
+
+    def set(self, uid, step, data):
+        self._pending()[uid] = (step, dict(data or {}))
+
+    def clear(self, uid):
+        self._pending()[uid] = None
+
+    def get(self, uid):
+        pending = g.get("_conv_state_pending") or {}
+        if uid in pending:
+            value = pending[uid]
+            return (None, {}) if value is None else (value[0], dict(value[1]))
+        return self._read(uid)
+
+    def flush(self):
+        # Redis no participa de la transacción SQL: escribimos justo antes del commit
+        pending = g.pop("_conv_state_pending", None)
+        if not pending:
+            return
+        pipe = self.client.pipeline()
+        for uid, value in pending.items():
+            if value is None:
+                pipe.delete(self._key(uid))
+            else:
+                payload = json.dumps({"step": value[0], "data": value[1]})
+                pipe.set(self._key(uid), payload, ex=self.ttl or None)
+        pipe.execute()
+
+    def discard(self):
+        g.pop("_conv_state_pending", None)
+
+
+def init_conv_state(app):
+    backend = (app.config.get("CONV_STATE_BACKEND") or "memory").lower()
+    ttl = int(app.config.get("CONV_STATE_TTL_SECONDS", 3600))
+    if backend == "db":
+        store = DbStateStore()
+    elif backend == "redis":
+        url = app.config.get("REDIS_URL") or ""
+        if not url:
+            raise RuntimeError("CONV_STATE_BACKEND=redis requiere REDIS_URL")
+        store = RedisStateStore(url, ttl_seconds=ttl)
+    else:
+        store = MemoryStateStore(
+            max_entries=int(app.config.get("CONV_STATE_MAX_ENTRIES", 5000)),
+            ttl_seconds=ttl,
+            write_mode=(app.config.get("CONV_STATE_WRITE") or "behind").lower(),
+        )
+    app.extensions["conv_state"] = store
+    return store
+
+
+def get_store():
+    return current_app.extensions["conv_state"]
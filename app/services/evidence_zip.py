@@ -0,0 +1,114 @@
+import csv, io, os, tempfile, zipfile
+from werkzeug.security import safe_join
+from ..models import PaymentRequest
+from .read_models import projected, iter_payment_batches
+from .excel_export import STREAM_BATCH
+
+# Formatos ya comprimidos: deflate solo gasta CPU
+STORED_EXTS = {".jpg", ".jpeg", ".png", ".pdf", ".webp", ".gif", ".zip"}
+READ_CHUNK = 256 * 1024
+# El manifiesto crece con el número de archivos: pasa a disco por encima de esto
+MANIFEST_SPOOL_BYTES = 1024 * 1024
+MANIFEST_FIELDS = [
+    "payment_id",
+    "cliente",
+    "valor",
+    "estado",
+    "evidence_id",
+    "archivo",
+    "sha256",
+    "size_bytes",
+    "incluido",
+]
+
+
+class _Sink(io.RawIOBase):
+    """Destino no buscable para ZipFile: acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _entry_name(pid, filename):
+    return f"{pid}/{os.path.basename(filename)}"
+
+
+def iter_evidence_zip(flt, evid_dir):
+    """
+    ZIP de las evidencias de los pagos filtrados, generado en vuelo: cada
+    archivo se lee por bloques y sale tal cual se comprime, sin armar el ZIP
+    en memoria ni en disco (ZipFile usa data descriptors al no poder buscar).
+    Al final agrega manifest.csv con la relación pago -> archivos.
+    """
+    sink = _Sink()
+    manifest = tempfile.SpooledTemporaryFile(
+        max_size=MANIFEST_SPOOL_BYTES, mode="w+", encoding="utf-8", newline=""
+    )
+    writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS)
+    writer.writeheader()
+    q = projected(flt.apply(PaymentRequest.query))
+    with manifest, zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        # cada lote se lee completo y se cierra antes de leer sus archivos
+        for batch in iter_payment_batches(q, flt.tz, STREAM_BATCH):
+            for p in batch:
+                for ev in p.evidences:
+                    filename = ev.filename or ""
+                    path = safe_join(evid_dir, filename) if filename else None
+                    included = bool(path and os.path.isfile(path))
+                    name = _entry_name(p.id, filename) if included else ""
+                    if included:
+                        ext = os.path.splitext(filename)[1].lower()
+                        info = zipfile.ZipInfo.from_file(path, name)
+                        info.compress_type = (
+                            zipfile.ZIP_STORED if ext in STORED_EXTS else zipfile.ZIP_DEFLATED
+                        )
+                        with open(path, "rb") as src, zf.open(
+                            info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT
+                        ) as dest:
+                            while True:
+                                block = src.read(READ_CHUNK)
+                                if not block:
+                                    break
+                                dest.write(block)
+                                data = sink.drain()
+                                if data:
+                                    yield data
+                    writer.writerow(
+                        {
+                            "payment_id": p.id,
+                            "cliente": p.cliente or "",
+                            "valor": p.valor if p.valor is not None else "",
+                            "estado": p.estado.value if p.estado else "",
+                            "evidence_id": ev.id,
+                            "archivo": name,
+                            "sha256": ev.sha256 or "",
+                            "size_bytes": ev.size_bytes if ev.size_bytes is not None else "",
+                            "incluido": "si" if included else "no (archivo no encontrado)",
+                        }
+                    )
+                    data = sink.drain()
+                    if data:
+                        yield data
+        manifest.seek(0)
+        with zf.open("manifest.csv", "w") as dest:
+            while True:
+                block = manifest.read(READ_CHUNK)
+                if not block:
+                    break
+                dest.write(block.encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
@@ -0,0 +1,207 @@
+import os, tempfile
+from collections import deque
+from ..models import PaymentRequest
+from .read_models import projected, iter_payment_batches
+
+HEADERS = [
+    "ID",
+    "Cliente",
+    "Valor",
+    "Medio de pago",
+    "Sucursal",
+    "Fecha consignación",
+    "Sociedad",
+    "Estado",
+    "Motivo rechazo",
+    "Creado UTC",
+    "Actualizado UTC",
+    "Creado (local)",
+    "Actualizado (local)",
+    "Telegram User ID",
+    "Chat ID respuesta",
+    "Evidencias (archivos)",
+]
+WIDTHS = [8, 28, 14, 22, 22, 18, 14, 12, 28, 20, 20, 18, 18, 16, 16, 36]
+VALOR_COL = 2  # índice 0-based de "Valor"
+
+EVID_HEADERS = ["Pago ID", "Cliente", "Archivo", "Imagen"]
+EVID_WIDTHS = [10, 28, 36, 50]  # en D se ancla la imagen
+# Imágenes reducidas en vuelo (en el pool) antes de escribirlas en orden
+EMBED_WINDOW = 64
+
+# Filas por lote (cada lote se lee completo y se cierra la lectura)
+STREAM_BATCH = 1000
+
+
+def export_filename(flt, include_images):
+    suffix = ""
+    if flt.estado_str:
+        suffix += f"_{flt.estado_str.lower()}"
+    if flt.sociedad_str:
+        suffix += f"_{flt.sociedad_str.lower()}"
+    if flt.desde_str or flt.hasta_str:
+        suf_d = flt.desde_str or ""
+        suf_h = flt.hasta_str or ""
+        suffix += f"_{suf_d}_a_{suf_h}"
+    if include_images:
+        suffix += "_con_imagenes"
+    return f"bandeja_pagos{suffix}.xlsx"
+
+
+def _header_row(ws, headers):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment
+
+    cells = []
+    for title in headers:
+        c = WriteOnlyCell(ws, value=title)
+        c.font = Font(bold=True)
+        c.alignment = Alignment(vertical="center")
+        cells.append(c)
+    return cells
+
+
+def _setup_sheet(ws, headers, widths):
+    """Anchos y paneles van antes de la primera fila (write-only no permite cambiarlos después)."""
+    from openpyxl.utils import get_column_letter
+
+    for i, w in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = w
+    ws.freeze_panes = "A2"
+    ws.append(_header_row(ws, headers))
+
+
+def _payment_values(p):
+    return [
+        p.id,
+        p.cliente or "",
+        p.valor or 0,
+        p.medio_pago or "",
+        p.sucursal or "",
+        (p.fecha_consignacion.isoformat() if p.fecha_consignacion else ""),
+        (p.sociedad.value if p.sociedad else ""),
+        p.estado.value if p.estado else "",
+        p.motivo_rechazo or "",
+        (p.created_at.isoformat(sep=" ") if p.created_at else ""),
+        (p.updated_at.isoformat(sep=" ") if p.updated_at else ""),
+        p.created_local_str or "",
+        p.updated_local_str or "",
+        p.telegram_user_id or "",
+        p.chat_id_respuesta or "",
+        ", ".join(ev.filename or "" for ev in p.evidences),
+    ]
+
+
+def _embed_source(app, filename):
+    """Mejor origen para la miniatura: la variante "medium" si ya existe, si no el original."""
+    from .thumbnails import is_image, variant_path
+
+    if not is_image(filename):
+        return None
+    evid_dir = app.config["EVID_DIR"]
+    rel = variant_path(app, filename, "medium")
+    src = os.path.join(evid_dir, rel or filename)
+    return src if os.path.exists(src) else None
+
+
+def _append_evidence(ws, row_idx, pid, cliente, filename, future):
+    from openpyxl.drawing.image import Image as XLImage
+
+    note = None
+    if future is None:
+        # No imagen compatible (pdf u otro)
+        note = "(No es imagen o no existe)"
+    else:
+        try:
+            dest, (w, h) = future.result()
+            xl_img = XLImage(dest)
+            xl_img.width, xl_img.height = w, h
+            ws.add_image(xl_img, f"D{row_idx}")
+            # Ajuste de alto de fila (puntos). Aproximación: px * 0.75
+            ws.row_dimensions[row_idx].height = max(22, int(h * 0.75))
+        except Exception as e:
+            note = f"(No se pudo incrustar: {e})"
+    if note:
+        ws.row_dimensions[row_idx].height = 22
+    ws.append([pid, cliente, filename, note])
+
+
+class _Embedded:
+    """Future de (ruta, tamaño) sobre el Future del pool que retorna solo el tamaño."""
+
+    __slots__ = ("dest", "future")
+
+    def __init__(self, dest, future):
+        self.dest, self.future = dest, future
+
+    def result(self):
+        return self.dest, self.future.result()
+
+
+def write_payments_xlsx(app, fileobj, flt, include_images=False, progress=None):
+    """
+    Escribe la bandeja filtrada en `fileobj` con memoria constante: workbook
+    write-only (openpyxl vuelca cada hoja a disco al agregar filas) alimentado
+    por lotes de STREAM_BATCH pagos; ninguna lectura queda abierta mientras se
+    escribe o se esperan imágenes. `progress(n)` se llama tras cada lote.
+    Retorna el número de pagos exportados.
+
+    Con imágenes, cada evidencia se reduce y recomprime (EXPORT_IMAGE_MAX_W/H,
+    EXPORT_IMAGE_QUALITY) en el pool de miniaturas; hasta EMBED_WINDOW van en
+    paralelo y se escriben en orden. Las copias viven en un directorio temporal
+    hasta guardar el libro (openpyxl las lee al final).
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from .thumbnails import submit_embed
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Pagos")
+    _setup_sheet(ws, HEADERS, WIDTHS)
+    ws2 = None
+    if include_images:
+        ws2 = wb.create_sheet(title="Evidencias")
+        _setup_sheet(ws2, EVID_HEADERS, EVID_WIDTHS)
+    max_w = int(app.config.get("EXPORT_IMAGE_MAX_W", 420))
+    max_h = int(app.config.get("EXPORT_IMAGE_MAX_H", 300))
+    quality = int(app.config.get("EXPORT_IMAGE_QUALITY", 70))
+
+    q = projected(flt.apply(PaymentRequest.query))
+    count = 0
+    row_idx2 = 2
+    pending = deque()
+    with tempfile.TemporaryDirectory(prefix="xlsx-img-") as tmpdir:
+
+        def drain(limit):
+            nonlocal row_idx2
+            while len(pending) > limit:
+                _append_evidence(ws2, row_idx2, *pending.popleft())
+                row_idx2 += 1
+
+        for batch in iter_payment_batches(q, flt.tz, STREAM_BATCH):
+            for p in batch:
+                values = _payment_values(p)
+                # formato numérico (columna Valor)
+                valor = WriteOnlyCell(ws, value=values[VALOR_COL])
+                valor.number_format = "#,##0"
+                values[VALOR_COL] = valor
+                ws.append(values)
+                count += 1
+                if ws2 is not None:
+                    for ev in p.evidences:
+                        filename = ev.filename or ""
+                        src = _embed_source(app, filename)
+                        embedded = None
+                        if src:
+                            dest = os.path.join(tmpdir, f"{ev.id}.jpg")
+                            future = submit_embed(app, src, dest, max_w, max_h, quality)
+                            embedded = _Embedded(dest, future)
+                        pending.append((p.id, p.cliente or "", filename, embedded))
+                        drain(EMBED_WINDOW)
+            if progress:
+                progress(count)
+        if ws2 is not None:
+            drain(0)
+
+        wb.save(fileobj)
+    return count
@@ -0,0 +1,206 @@
+import os, json, uuid, hashlib, datetime, threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, update
+from ..extensions import db
+from ..models import ExportJob, PaymentRequest, Evidence, UpdateStatus
+from .payment_filters import PaymentFilter
+from .excel_export import write_payments_xlsx, export_filename
+
+_executor = None
+_image_slots = None
+_executor_lock = threading.Lock()
+
+ACTIVE = (UpdateStatus.PENDIENTE, UpdateStatus.PROCESANDO)
+
+
+def export_dir(app):
+    path = app.config["EXPORT_DIR"]
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def result_path(app, job):
+    """Los archivos se nombran por cache_key: exportaciones idénticas comparten archivo."""
+    return os.path.join(export_dir(app), f"{job.cache_key}.xlsx")
+
+
+def data_version():
+    """Cambia si se crea, edita o borra un pago, o se adjunta una evidencia."""
+    max_updated, count = db.session.query(
+        func.max(PaymentRequest.updated_at), func.count(PaymentRequest.id)
+    ).one()
+    max_evid = db.session.query(func.max(Evidence.id)).scalar()
+    return f"{max_updated.isoformat() if max_updated else ''}|{count}|{max_evid or 0}"
+
+
+def cache_key(flt, include_images):
+    """Hash de los filtros ya interpretados (no del texto crudo) + versión de los datos."""
+    normalized = {
+        "estado": flt.estado.value if flt.estado else None,
+        "sociedad": flt.sociedad.value if flt.sociedad else None,
+        "q": " ".join(flt.q_str.split()),
+        "desde": flt.desde_utc.isoformat() if flt.desde_utc else None,
+        "hasta": flt.hasta_utc.isoformat() if flt.hasta_utc else None,
+        "vmin": flt.vmin,
+        "vmax": flt.vmax,
+        "imagenes": bool(include_images),
+        "v": data_version(),
+    }
+    raw = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _get_executor(app):
+    global _executor, _image_slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # las exportaciones con imágenes consumen mucha memoria: cupo aparte
+                _image_slots = threading.BoundedSemaphore(
+                    max(1, int(app.config.get("EXPORT_IMAGE_SLOTS", 1)))
+                )
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(app.config.get("EXPORT_WORKERS", 2)),
+                    thread_name_prefix="export",
+                )
+    return _executor
+
+
+def _is_stale(app, job):
+    """Trabajo activo que ya no avanza (p.ej. el proceso que lo corría murió)."""
+    limit = datetime.timedelta(seconds=int(app.config.get("EXPORT_JOB_TIMEOUT_SECONDS", 1800)))
+    since = job.started_at or job.created_at
+    return job.status in ACTIVE and since is not None and datetime.datetime.utcnow() - since > limit
+
+
+def get_job(app, token):
+    job = ExportJob.query.filter_by(token=token).first()
+    if job is not None and _is_stale(app, job):
+        job.status = UpdateStatus.ERROR
+        job.error = "Tiempo de exportación agotado"
+        db.session.commit()
+    return job
+
+
+def submit(app, flt, include_images):
+    """
+    Retorna el ExportJob para estos filtros: uno ya terminado cuyo archivo
+    sigue en disco, uno en curso (doble clic), o uno nuevo encolado.
+    """
+    key = cache_key(flt, include_images)
+    existing = (
+        ExportJob.query.filter(
+            ExportJob.cache_key == key,
+            ExportJob.status.in_(ACTIVE + (UpdateStatus.HECHO,)),
+        )
+        .order_by(ExportJob.id.desc())
+        .first()
+    )
+    if existing is not None:
+        if existing.status == UpdateStatus.HECHO:
+            if os.path.exists(result_path(app, existing)):
+                return existing
+        elif not _is_stale(app, existing):
+            return existing
+
+    job = ExportJob(
+        token=uuid.uuid4().hex,
+        cache_key=key,
+        params=json.dumps(flt.to_args(), ensure_ascii=False),
+        include_images=bool(include_images),
+        status=UpdateStatus.PENDIENTE,
+        progress=0,
+        filename=export_filename(flt, include_images),
+    )
+    db.session.add(job)
+    db.session.commit()
+    _get_executor(app).submit(run_job, app, job.id)
+    return job
+
+
+def _set_progress(app, job_id, n):
+    # transacción corta y propia: se llama entre lotes, sin lecturas abiertas
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(update(ExportJob).where(ExportJob.id == job_id).values(progress=n))
+    except Exception as e:
+        app.logger.warning(f"Progreso de exportación {job_id}: {e}")
+
+
+def run_job(app, job_id):
+    """Genera el archivo de un ExportJob (corre en el pool de exportaciones)."""
+    slots = None
+    tmp = None
+    with app.app_context():
+        try:
+            job = db.session.get(ExportJob, job_id)
+            if job is None:
+                return
+            if job.include_images:
+                # sigue PENDIENTE mientras espera cupo
+                slots = _image_slots
+                slots.acquire()
+            job.status = UpdateStatus.PROCESANDO
+            job.started_at = datetime.datetime.utcnow()
+            flt = PaymentFilter.from_args(
+                json.loads(job.params), app.config.get("TIMEZONE", "America/Bogota")
+            )
+            job.total = flt.aggregates()[3]
+            db.session.commit()
+
+            path = result_path(app, job)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(tmp, "wb") as out:
+                count = write_payments_xlsx(
+                    app,
+                    out,
+                    flt,
+                    job.include_images,
+                    progress=lambda n: _set_progress(app, job_id, n),
+                )
+            os.replace(tmp, path)
+            tmp = None
+
+            job = db.session.get(ExportJob, job_id)
+            job.status = UpdateStatus.HECHO
+            job.progress = count
+            job.finished_at = datetime.datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            app.logger.exception(f"Exportación {job_id} falló")
+            db.session.rollback()
+            job = db.session.get(ExportJob, job_id)
+            if job is not None:
+                job.status = UpdateStatus.ERROR
+                job.error = str(e)[:1000]
+                job.finished_at = datetime.datetime.utcnow()
+                db.session.commit()
+        finally:
+            if slots is not None:
+                slots.release()
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            db.session.remove()
+
+
+def purge_exports(app):
+    """Borra trabajos y archivos más viejos que EXPORT_RETENTION_HOURS. Retorna (trabajos, archivos)."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(
+        hours=int(app.config.get("EXPORT_RETENTION_HOURS", 24))
+    )
+    jobs = ExportJob.query.filter(
+        ExportJob.created_at < cutoff, ExportJob.status.notin_(ACTIVE)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    files = 0
+    base = export_dir(app)
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        try:
+            mtime = datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
+            if os.path.isfile(path) and mtime < cutoff:
+                os.remove(path)
+                files += 1
+        except OSError:
+            pass
+    return jobs, files
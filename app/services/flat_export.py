@@ -0,0 +1,97 @@
+import csv, io, json, zlib
+from ..models import PaymentRequest
+from .read_models import projected, iter_payment_batches
+from .excel_export import STREAM_BATCH
+
+FIELDS = [
+    "id",
+    "cliente",
+    "valor",
+    "medio_pago",
+    "sucursal",
+    "fecha_consignacion",
+    "sociedad",
+    "estado",
+    "motivo_rechazo",
+    "created_at",
+    "updated_at",
+    "created_local",
+    "updated_local",
+    "telegram_user_id",
+    "chat_id_respuesta",
+    "evidencias",
+]
+# Filas por bloque enviado al cliente
+CHUNK_ROWS = 200
+
+
+def _record(p):
+    return {
+        "id": p.id,
+        "cliente": p.cliente,
+        "valor": p.valor,
+        "medio_pago": p.medio_pago,
+        "sucursal": p.sucursal,
+        "fecha_consignacion": p.fecha_consignacion.isoformat() if p.fecha_consignacion else None,
+        "sociedad": p.sociedad.value if p.sociedad else None,
+        "estado": p.estado.value if p.estado else None,
+        "motivo_rechazo": p.motivo_rechazo,
+        "created_at": p.created_at.isoformat(sep=" ") if p.created_at else None,
+        "updated_at": p.updated_at.isoformat(sep=" ") if p.updated_at else None,
+        "created_local": p.created_local_str,
+        "updated_local": p.updated_local_str,
+        "telegram_user_id": p.telegram_user_id,
+        "chat_id_respuesta": p.chat_id_respuesta,
+        "evidencias": [ev.filename for ev in p.evidences if ev.filename],
+    }
+
+
+def _rows(flt):
+    # por lotes cerrados: una descarga lenta no mantiene abierta la lectura
+    q = projected(flt.apply(PaymentRequest.query))
+    for batch in iter_payment_batches(q, flt.tz, STREAM_BATCH):
+        for p in batch:
+            yield _record(p)
+
+
+def iter_csv(flt):
+    """Bloques de texto CSV (encabezado primero). Evidencias separadas por ';'."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=FIELDS)
+    writer.writeheader()
+    # el encabezado sale de inmediato, antes de ejecutar la consulta
+    yield buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    n = 0
+    for rec in _rows(flt):
+        rec["evidencias"] = ";".join(rec["evidencias"])
+        writer.writerow(rec)
+        n += 1
+        if n % CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_jsonl(flt):
+    """Bloques JSON Lines: un objeto por pago."""
+    lines = []
+    for rec in _rows(flt):
+        lines.append(json.dumps(rec, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def gzip_stream(chunks):
+    """Comprime en vuelo (formato gzip) una secuencia de bloques de texto."""
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # SYNC_FLUSH por bloque: el cliente recibe bytes sin esperar al final
+        yield comp.compress(chunk.encode("utf-8")) + comp.flush(zlib.Z_SYNC_FLUSH)
+    yield comp.flush()
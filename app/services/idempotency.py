@@ -0,0 +1,71 @@
+import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from ..extensions import db
+from ..models import ProcessedUpdate
+
+
+def update_keys(update):
+    """
+    Claves de idempotencia de un update: su update_id y, para mensajes,
+    chat+message_id, de modo que un edited_message del mismo mensaje
+    cuenta como ya procesado.
+    """
+    keys = []
+    if update.get("update_id") is not None:
+        keys.append(f"u:{update['update_id']}")
+    msg = update.get("message") or update.get("edited_message")
+    if msg and msg.get("message_id") is not None:
+        chat_id = (msg.get("chat") or {}).get("id")
+        keys.append(f"m:{chat_id}:{msg['message_id']}")
+    return keys
+
+
+def already_processed(update):
+    """
+    Chequeo de solo lectura contra el ledger, antes de procesar. No escribe:
+    así la E/S con Telegram (descarga de evidencias) no corre dentro de una
+    transacción de escritura que en SQLite bloquearía a los demás.
+    """
+    keys = update_keys(update)
+    if not keys:
+        return False
+    return (
+        db.session.query(ProcessedUpdate.id)
+        .filter(ProcessedUpdate.update_key.in_(keys))
+        .first()
+        is not None
+    )
+
+
+def claim_update(update):
+    """
+    Registra el update en el ledger. True si es la primera entrega; False si
+    ya se había procesado. La restricción UNIQUE sobre update_key hace que sea
+    correcto entre varios workers de gunicorn. Solo hace flush y se llama al
+    final del procesamiento, justo antes del commit: la entrada se confirma
+    junto con el resto del update, y si otra entrega concurrente ganó, el
+    rollback descarta todo lo hecho por esta.
+    """
+    keys = update_keys(update)
+    if not keys:
+        return True
+    try:
+        for key in keys:
+            db.session.add(ProcessedUpdate(update_key=key))
+        db.session.flush()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def purge_processed():
+    """Borra entradas más viejas que PROCESSED_UPDATES_TTL_HOURS."""
+    hours = int(current_app.config.get("PROCESSED_UPDATES_TTL_HOURS", 72))
+    threshold = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    n = ProcessedUpdate.query.filter(ProcessedUpdate.created_at < threshold).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    return n
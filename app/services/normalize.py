@@ -0,0 +1,27 @@
+import re, unicodedata
+from sqlalchemy import and_
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def search_key(text, max_len=120):
+    """
+    Clave de búsqueda: sin tildes, en minúsculas (casefold) y con espacios
+    colapsados. "  Juan   Pérez " -> "juan perez".
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SPACES_RE.sub(" ", stripped.casefold()).strip()[:max_len]
+
+
+def prefix_filter(column, key, dialect_name):
+    """
+    Coincidencia por prefijo que usa el índice de `column`. En SQLite LIKE no
+    usa un índice BINARY, así que se expresa como rango [key, sucesor(key)).
+    """
+    if dialect_name == "sqlite":
+        upper = key[:-1] + chr(ord(key[-1]) + 1)
+        return and_(column >= key, column < upper)
+    return column.startswith(key, autoescape=True)
@@ -0,0 +1,151 @@
+import base64, datetime, json
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(direction, created_at=None, row_id=None, page=1):
+    """
+    Token opaco de paginación por clave (created_at, id).
+    direction: "next" (filas posteriores a la clave), "prev" (anteriores) o "last".
+    """
+    payload = {"d": direction, "p": int(page)}
+    if created_at is not None:
+        payload["t"] = created_at.isoformat()
+        payload["i"] = int(row_id)
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Retorna dict con d/t/i/p, o None si el token no es válido (→ primera página)."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        direction = payload.get("d")
+        if direction not in ("next", "prev", "last"):
+            return None
+        cursor = {"d": direction, "p": max(1, int(payload.get("p", 1)))}
+        if direction != "last":
+            cursor["t"] = datetime.datetime.fromisoformat(payload["t"])
+            cursor["i"] = int(payload["i"])
+        return cursor
+    except Exception:
+        return None
+
+
+def _window(query, model, rows, page, pages, per_page, window):
+    """
+    [(número, token)] de las páginas vecinas (hasta `window` a cada lado; token
+    None = página actual). Los tokens salen de una consulta de solo claves por
+    sentido, limitada a window * per_page filas del índice: sin OFFSET.
+    """
+    created, pk = model.created_at, model.id
+    keys = query.with_entities(created, pk)
+    links = [(page, None)]
+    if not rows:
+        return links
+    first, last = rows[0], rows[-1]
+
+    # hacia atrás: la página page-1-j empieza antes de la fila (j*per_page - 1) anterior
+    back = min(window, page - 1)
+    if back > 0:
+        prev_keys = []
+        if back > 1:
+            before = or_(created > first.created_at, and_(created == first.created_at, pk > first.id))
+            prev_keys = keys.filter(before).order_by(created.asc(), pk.asc()).limit((back - 1) * per_page).all()
+        for j in range(1, back + 1):
+            n = page - j
+            if n == 1:
+                token = ""
+            elif j == 1:
+                token = encode_cursor("prev", first.created_at, first.id, n)
+            elif len(prev_keys) >= (j - 1) * per_page:
+                k = prev_keys[(j - 1) * per_page - 1]
+                token = encode_cursor("prev", k[0], k[1], n)
+            else:
+                break  # el total cambió: no hay tantas filas
+            links.insert(0, (n, token))
+
+    # hacia adelante: la página page+1+j empieza después de la fila j*per_page - 1 siguiente
+    ahead = min(window, pages - page)
+    if ahead > 0:
+        next_keys = []
+        if ahead > 1:
+            after = or_(created < last.created_at, and_(created == last.created_at, pk < last.id))
+            next_keys = keys.filter(after).order_by(created.desc(), pk.desc()).limit((ahead - 1) * per_page).all()
+        for j in range(1, ahead + 1):
+            n = page + j
+            if j == 1:
+                token = encode_cursor("next", last.created_at, last.id, n)
+            elif len(next_keys) >= (j - 1) * per_page:
+                k = next_keys[(j - 1) * per_page - 1]
+                token = encode_cursor("next", k[0], k[1], n)
+            else:
+                break  # el total cambió: no hay tantas filas
+            links.append((n, token))
+    return links
+
+
+def keyset_page(query, model, cursor, per_page, total, window=2):
+    """
+    Página de `query` ordenada por (created_at DESC, id DESC) sin OFFSET:
+    cualquier página cuesta lo mismo que la primera (usa el índice de la clave).
+    Retorna (rows, page, pages, nav) donde nav tiene los tokens first/prev/next/last
+    (None si no aplica) y en "window" las páginas vecinas [(número, token)].
+
+    `total` (p.ej. del rollup) solo estima `pages`; si hay página siguiente lo
+    decide la consulta (per_page + 1 filas), así un total desfasado no deja
+    filas fuera de alcance.
+    """
+    created, pk = model.created_at, model.id
+    pages = max(1, (total + per_page - 1) // per_page)
+    direction = cursor["d"] if cursor else None
+    # una fila de más en el sentido de avance dice si hay página más allá
+    has_prev = has_next = False
+
+    if direction == "next":
+        after = or_(created < cursor["t"], and_(created == cursor["t"], pk < cursor["i"]))
+        rows = query.filter(after).order_by(created.desc(), pk.desc()).limit(per_page + 1).all()
+        has_prev, has_next = True, len(rows) > per_page
+        rows = rows[:per_page]
+        page = cursor["p"]
+    elif direction == "prev":
+        before = or_(created > cursor["t"], and_(created == cursor["t"], pk > cursor["i"]))
+        rows = query.filter(before).order_by(created.asc(), pk.asc()).limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page]
+        rows.reverse()
+        page = cursor["p"]
+    elif direction == "last":
+        tail = max(total - (pages - 1) * per_page, 1)
+        rows = query.order_by(created.asc(), pk.asc()).limit(tail + 1).all()
+        has_prev = len(rows) > tail
+        rows = rows[:tail]
+        rows.reverse()
+        page = max(pages, cursor["p"])
+    else:
+        rows = query.order_by(created.desc(), pk.desc()).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        page = 1
+
+    # El total puede cambiar entre páginas; si la navegación queda vacía se vuelve al inicio
+    if not rows and direction in ("next", "prev"):
+        return keyset_page(query, model, None, per_page, total, window)
+    # numeración estimada: se corrige contra lo que la consulta encontró
+    if not has_prev:
+        page = 1
+    elif page < 2:
+        page = 2
+    pages = max(pages, page + 1) if has_next else page
+
+    nav = {"first": None, "prev": None, "next": None, "last": None}
+    if has_prev:
+        nav["first"] = ""
+        nav["prev"] = encode_cursor("prev", rows[0].created_at, rows[0].id, page - 1)
+    if has_next:
+        nav["next"] = encode_cursor("next", rows[-1].created_at, rows[-1].id, page + 1)
+        nav["last"] = encode_cursor("last", page=pages)
+    nav["window"] = _window(query, model, rows, page, pages, per_page, window)
+    return rows, page, pages, nav
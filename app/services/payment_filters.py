@@ -0,0 +1,139 @@
+import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import func
+from ..extensions import db
+from ..models import PaymentRequest, Estado, Sociedad
+from .search import smart_filter
+
+
+def local_tz(tz_name):
+    try:
+        return ZoneInfo(tz_name)
+    except Exception:
+        return datetime.timezone.utc
+
+
+def _local_day_to_utc(day_str, tz, plus_days=0):
+    d_local = (
+        datetime.datetime.strptime(day_str, "%Y-%m-%d") + datetime.timedelta(days=plus_days)
+    ).replace(tzinfo=tz)
+    return d_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _to_int(raw):
+    try:
+        return int(raw) if raw else None
+    except Exception:
+        return None
+
+
+class PaymentFilter:
+    """
+    Filtros de la bandeja (estado, q, fechas locales, sociedad, rango de valor)
+    interpretados una sola vez y reutilizables por el listado y las exportaciones.
+    Los atributos *_str conservan lo que escribió el usuario para la vista.
+    """
+
+    def __init__(self, estado="", q="", desde="", hasta="", sociedad="", valor_min="", valor_max="", tz_name="America/Bogota"):
+        self.estado_str = estado
+        self.q_str = q
+        self.desde_str = desde
+        self.hasta_str = hasta
+        self.sociedad_str = sociedad
+        self.valor_min_str = valor_min
+        self.valor_max_str = valor_max
+        self.tz = local_tz(tz_name)
+
+        self.estado = Estado(estado) if estado in [e.value for e in Estado] else None
+        self.sociedad = Sociedad(sociedad) if sociedad in [s.value for s in Sociedad] else None
+        self.vmin = _to_int(valor_min)
+        self.vmax = _to_int(valor_max)
+        if self.vmin is not None and self.vmax is not None and self.vmin > self.vmax:
+            self.vmin, self.vmax = self.vmax, self.vmin
+        # Filtros de fecha interpretados en zona local y convertidos a UTC
+        self.desde_utc = None
+        self.hasta_utc = None
+        if desde:
+            try:
+                self.desde_utc = _local_day_to_utc(desde, self.tz)
+            except Exception:
+                pass
+        if hasta:
+            try:
+                self.hasta_utc = _local_day_to_utc(hasta, self.tz, plus_days=1)
+            except Exception:
+                pass
+
+    @classmethod
+    def from_args(cls, args, tz_name="America/Bogota"):
+        return cls(
+            estado=(args.get("estado") or "").strip(),
+            q=(args.get("q") or "").strip(),
+            desde=(args.get("desde") or "").strip(),
+            hasta=(args.get("hasta") or "").strip(),
+            sociedad=(args.get("sociedad") or "").strip().upper(),
+            valor_min=(args.get("valor_min") or "").strip(),
+            valor_max=(args.get("valor_max") or "").strip(),
+            tz_name=tz_name,
+        )
+
+    def apply(self, query, with_estado=True):
+        """Aplica los filtros; with_estado=False para agregados por estado."""
+        if with_estado and self.estado is not None:
+            query = query.filter(PaymentRequest.estado == self.estado)
+        if self.q_str:
+            query = query.filter(smart_filter(self.q_str, self.tz))
+        if self.desde_utc is not None:
+            query = query.filter(PaymentRequest.created_at >= self.desde_utc)
+        if self.hasta_utc is not None:
+            query = query.filter(PaymentRequest.created_at < self.hasta_utc)
+        if self.sociedad is not None:
+            query = query.filter(PaymentRequest.sociedad == self.sociedad)
+        if self.vmin is not None:
+            query = query.filter(PaymentRequest.valor >= self.vmin)
+        if self.vmax is not None:
+            query = query.filter(PaymentRequest.valor <= self.vmax)
+        return query
+
+    def to_args(self, **overrides):
+        """Parámetros no vacíos para url_for (los links conservan los filtros)."""
+        values = {
+            "estado": self.estado_str,
+            "q": self.q_str,
+            "desde": self.desde_str,
+            "hasta": self.hasta_str,
+            "sociedad": self.sociedad_str,
+            "valor_min": self.valor_min_str,
+            "valor_max": self.valor_max_str,
+        }
+        values.update(overrides)
+        return {k: v for k, v in values.items() if v}
+
+    def aggregates(self):
+        """
+        Conteo y suma por estado en una sola consulta (GROUP BY estado, sin
+        filtrar estado para ver la distribución completa). El total del listado
+        se deriva de aquí: no hace falta un COUNT aparte.
+        Retorna (counts_by_status, sums_by_status, sum_total, total_listado).
+        """
+        rows = self.apply(
+            db.session.query(
+                PaymentRequest.estado,
+                func.count(PaymentRequest.id),
+                func.coalesce(func.sum(PaymentRequest.valor), 0),
+            ),
+            with_estado=False,
+        ).group_by(PaymentRequest.estado).all()
+        counts = {e.value: 0 for e in Estado}
+        sums = {e.value: 0 for e in Estado}
+        for est, cnt, total in rows:
+            if est is None:
+                continue
+            counts[est.value] = int(cnt)
+            sums[est.value] = int(total or 0)
+        sum_total = sum(int(total or 0) for _, _, total in rows)
+        if self.estado is not None:
+            listed = counts[self.estado.value]
+        else:
+            listed = sum(int(cnt) for _, cnt, _ in rows)
+        return counts, sums, sum_total, listed
@@ -0,0 +1,128 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ..extensions import db
+from ..models import BotCursor
+from .telegram import get_client, update_user_id
+
+CURSOR_NAME = "getUpdates"
+# Cada cuánto (s) se purga el ledger de idempotencia, como en bot-worker
+MAINTENANCE_INTERVAL = 60
+
+
+def load_offset():
+    cur = BotCursor.query.filter_by(name=CURSOR_NAME).first()
+    return int(cur.value) if cur else 0
+
+
+def save_offset(offset):
+    cur = BotCursor.query.filter_by(name=CURSOR_NAME).first()
+    if not cur:
+        cur = BotCursor(name=CURSOR_NAME)
+        db.session.add(cur)
+    cur.value = int(offset)
+    db.session.commit()
+
+
+def fetch_updates(app, offset, limit=100, timeout=30):
+    """getUpdates con long polling; retorna la lista de updates (puede ser vacía)."""
+    r = get_client(app).request(
+        "getUpdates",
+        json={"offset": offset, "limit": limit, "timeout": timeout},
+        timeout=(3.05, timeout + 10),
+    )
+    r.raise_for_status()
+    data = r.json()
+    if not data.get("ok"):
+        raise RuntimeError(f"getUpdates error: {data}")
+    return data.get("result") or []
+
+
+def group_by_user(updates):
+    """Agrupa conservando el orden: los updates de un usuario van en secuencia."""
+    groups = {}
+    for u in updates:
+        groups.setdefault(update_user_id(u) or f"_{u.get('update_id')}", []).append(u)
+    return list(groups.values())
+
+
+def process_batch(app, handler, updates, executor):
+    """
+    Procesa el lote: usuarios independientes en paralelo, cada grupo en orden.
+    Un grupo se detiene en su primer fallo (los updates posteriores de ese
+    usuario no pueden adelantarse). Retorna (update, error) del fallo con
+    menor update_id, o None si todo se procesó.
+    """
+
+    def _run(group):
+        for u in group:
+            with app.app_context():
+                try:
+                    handler(u)
+                except Exception as e:
+                    app.logger.exception(f"poll update {u.get('update_id')} error: {e}")
+                    return u, e
+        return None
+
+    failures = [f for f in executor.map(_run, group_by_user(updates)) if f]
+    if not failures:
+        return None
+    return min(failures, key=lambda f: int(f[0]["update_id"]))
+
+
+def run_polling(app, handler, limit=100, timeout=30, concurrency=4):
+    """
+    Bucle de long polling. El offset se guarda en bot_cursor después de cada
+    lote; si el proceso cae a mitad, el lote se relee y el ledger de
+    idempotencia descarta lo ya procesado. Si un update falla, el offset no
+    pasa de él: se reintenta con backoff (lo ya procesado del lote lo descarta
+    el ledger) y tras QUEUE_MAX_ATTEMPTS queda en inbound_update como ERROR.
+    Cada MAINTENANCE_INTERVAL purga processed_update (PROCESSED_UPDATES_TTL_HOURS).
+    """
+    from .update_queue import park_failed
+    from .idempotency import purge_processed
+
+    max_attempts = int(app.config.get("QUEUE_MAX_ATTEMPTS", 5))
+    attempts = {}
+    next_maintenance = 0.0
+    with app.app_context():
+        offset = load_offset()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        while True:
+            if time.monotonic() >= next_maintenance:
+                next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                with app.app_context():
+                    try:
+                        purge_processed()
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error(f"poll mantenimiento error: {e}")
+            try:
+                updates = fetch_updates(app, offset, limit=limit, timeout=timeout)
+            except Exception as e:
+                app.logger.error(f"getUpdates error: {e}")
+                time.sleep(3)
+                continue
+            if not updates:
+                continue
+            failed = process_batch(app, handler, updates, executor)
+            if failed is None:
+                attempts.clear()
+                offset = max(int(u["update_id"]) for u in updates) + 1
+            else:
+                update, error = failed
+                update_id = int(update["update_id"])
+                n = attempts.get(update_id, 0) + 1
+                attempts = {update_id: n}
+                if n >= max_attempts:
+                    # no bloquea el bot para siempre: queda registrado y se sigue
+                    with app.app_context():
+                        park_failed(update, error, n)
+                    app.logger.error(f"poll: update {update_id} descartado tras {n} intentos")
+                    attempts.clear()
+                    offset = update_id + 1
+                else:
+                    offset = update_id
+                    time.sleep(min(2 ** n, 30))
+            with app.app_context():
+                save_offset(offset)
+            app.logger.info(f"poll: {len(updates)} updates, offset={offset}")
@@ -0,0 +1,54 @@
+import datetime
+from sqlalchemy import text
+from ..extensions import db
+from ..models import PaymentRequest, Evidence, Estado, Sociedad
+from .normalize import prefix_filter
+
+
+def canonical_queries():
+    """Consultas calientes de la bandeja y el bot: (nombre, Query)."""
+    created, pk = PaymentRequest.created_at, PaymentRequest.id
+    cutoff = datetime.datetime.utcnow()
+    return [
+        (
+            "bandeja: pendientes recientes",
+            PaymentRequest.query.filter(PaymentRequest.estado == Estado.PENDIENTE)
+            .order_by(created.desc(), pk.desc())
+            .limit(25),
+        ),
+        (
+            "bandeja: por sociedad",
+            PaymentRequest.query.filter(PaymentRequest.sociedad == Sociedad.COANDES)
+            .order_by(created.desc(), pk.desc())
+            .limit(25),
+        ),
+        (
+            "bandeja: página siguiente (keyset)",
+            PaymentRequest.query.filter(created < cutoff)
+            .order_by(created.desc(), pk.desc())
+            .limit(25),
+        ),
+        (
+            "bot: ver estado por cliente",
+            PaymentRequest.query.filter(
+                PaymentRequest.telegram_user_id == "0",
+                prefix_filter(PaymentRequest.cliente_key, "juan", db.engine.dialect.name),
+            )
+            .order_by((PaymentRequest.cliente_key == "juan").desc(), created.desc())
+            .limit(1),
+        ),
+        (
+            "evidencias de una página",
+            Evidence.query.filter(Evidence.payment_id.in_([1, 2, 3])),
+        ),
+    ]
+
+
+def explain(query):
+    """Plan del motor actual para una Query (EXPLAIN / EXPLAIN QUERY PLAN)."""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN" if dialect.name == "sqlite" else "EXPLAIN"
+    rows = db.session.execute(text(f"{prefix} {sql}")).fetchall()
+    db.session.rollback()
+    return sql, [" | ".join(str(c) for c in row if c is not None) for row in rows]
@@ -0,0 +1,142 @@
+import datetime
+from sqlalchemy import and_, or_
+from ..extensions import db
+from ..models import PaymentRequest, Evidence
+
+# Columnas que usan la bandeja y las exportaciones (sin hidratar entidades ORM)
+PAYMENT_COLUMNS = (
+    PaymentRequest.id,
+    PaymentRequest.telegram_user_id,
+    PaymentRequest.chat_id_respuesta,
+    PaymentRequest.sucursal,
+    PaymentRequest.medio_pago,
+    PaymentRequest.cliente,
+    PaymentRequest.valor,
+    PaymentRequest.fecha_consignacion,
+    PaymentRequest.sociedad,
+    PaymentRequest.estado,
+    PaymentRequest.motivo_rechazo,
+    PaymentRequest.created_at,
+    PaymentRequest.updated_at,
+)
+
+EVIDENCE_COLUMNS = (
+    Evidence.id,
+    Evidence.payment_id,
+    Evidence.filename,
+    Evidence.tipo,
+    Evidence.sha256,
+    Evidence.size_bytes,
+)
+
+
+def local_str(dt, tz, fmt="%Y-%m-%d %H:%M"):
+    """datetime UTC ingenuo -> texto en la zona local (None si no hay fecha)."""
+    if not dt:
+        return None
+    return dt.replace(tzinfo=datetime.timezone.utc).astimezone(tz).strftime(fmt)
+
+
+class EvidenceRow:
+    __slots__ = ("id", "payment_id", "filename", "tipo", "sha256", "size_bytes")
+
+    def __init__(self, row):
+        self.id, self.payment_id, self.filename, self.tipo, self.sha256, self.size_bytes = row
+
+
+class PaymentRow:
+    """Fila de solo lectura de un pago con sus evidencias y fechas locales ya formateadas."""
+
+    __slots__ = (
+        "id",
+        "telegram_user_id",
+        "chat_id_respuesta",
+        "sucursal",
+        "medio_pago",
+        "cliente",
+        "valor",
+        "fecha_consignacion",
+        "sociedad",
+        "estado",
+        "motivo_rechazo",
+        "created_at",
+        "updated_at",
+        "created_local_str",
+        "updated_local_str",
+        "evidences",
+        "duplicate_of",
+    )
+
+    def __init__(self, row, tz):
+        (
+            self.id,
+            self.telegram_user_id,
+            self.chat_id_respuesta,
+            self.sucursal,
+            self.medio_pago,
+            self.cliente,
+            self.valor,
+            self.fecha_consignacion,
+            self.sociedad,
+            self.estado,
+            self.motivo_rechazo,
+            self.created_at,
+            self.updated_at,
+        ) = row
+        self.created_local_str = local_str(self.created_at, tz)
+        self.updated_local_str = local_str(self.updated_at, tz)
+        self.evidences = []
+        self.duplicate_of = []
+
+
+def projected(query):
+    """Restringe una Query de PaymentRequest a PAYMENT_COLUMNS (mismos filtros y orden)."""
+    return query.with_entities(*PAYMENT_COLUMNS)
+
+
+def attach_evidences(rows):
+    """Carga las evidencias de todas las filas con una sola consulta IN."""
+    by_id = {r.id: r for r in rows}
+    if not by_id:
+        return rows
+    evids = (
+        db.session.query(*EVIDENCE_COLUMNS)
+        .filter(Evidence.payment_id.in_(list(by_id)))
+        .order_by(Evidence.payment_id, Evidence.id)
+        .all()
+    )
+    for ev in evids:
+        by_id[ev.payment_id].evidences.append(EvidenceRow(ev))
+    return rows
+
+
+def payment_rows(raw_rows, tz):
+    """Tuplas de PAYMENT_COLUMNS -> [PaymentRow] con evidencias."""
+    return attach_evidences([PaymentRow(r, tz) for r in raw_rows])
+
+
+def iter_payment_batches(query, tz, batch_size=1000):
+    """
+    Recorre una Query proyectada (PAYMENT_COLUMNS, sin ORDER BY) en lotes de
+    PaymentRow por clave (created_at, id) DESC, como la bandeja. Cada lote se
+    lee completo, con sus evidencias en una consulta IN, y la transacción de
+    lectura se cierra antes de entregarlo: el consumidor puede tardar lo que
+    quiera (descargas lentas, imágenes) sin tener un cursor abierto, que en
+    SQLite bloquea a los escritores y en MySQL corta la conexión por
+    net_write_timeout. Solo para rutas de lectura (hace rollback por lote).
+    """
+    created, pk = PaymentRequest.created_at, PaymentRequest.id
+    last = None
+    while True:
+        q = query
+        if last is not None:
+            q = q.filter(or_(created < last[0], and_(created == last[0], pk < last[1])))
+        raw = q.order_by(created.desc(), pk.desc()).limit(batch_size).all()
+        rows = payment_rows(raw, tz)
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1].created_at, rows[-1].id)
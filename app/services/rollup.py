@@ -0,0 +1,202 @@
+import datetime
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from ..extensions import db
+from ..models import PaymentRequest, PaymentRollupDaily, Estado
+from .payment_filters import local_tz
+
+
+def _tz():
+    return local_tz(current_app.config.get("TIMEZONE", "America/Bogota"))
+
+
+def local_day(created_at, tz=None):
+    created_at = created_at or datetime.datetime.utcnow()
+    return created_at.replace(tzinfo=datetime.timezone.utc).astimezone(tz or _tz()).date()
+
+
+def rollup_key(p, estado=None, tz=None):
+    """(día local, sucursal, sociedad, estado, medio_pago) de un pago."""
+    return (
+        local_day(p.created_at, tz),
+        p.sucursal or "",
+        p.sociedad.value if p.sociedad else "",
+        estado or p.estado,
+        p.medio_pago or "",
+    )
+
+
+def _bump(key, d_count, d_total):
+    """UPDATE incremental y, si la fila aún no existe, INSERT (sin commit)."""
+    day, sucursal, sociedad, estado, medio_pago = key
+    match = PaymentRollupDaily.query.filter_by(
+        day=day, sucursal=sucursal, sociedad=sociedad, estado=estado, medio_pago=medio_pago
+    )
+    values = {
+        PaymentRollupDaily.count: PaymentRollupDaily.count + d_count,
+        PaymentRollupDaily.total: PaymentRollupDaily.total + d_total,
+    }
+    if match.update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                PaymentRollupDaily(
+                    day=day,
+                    sucursal=sucursal,
+                    sociedad=sociedad,
+                    estado=estado,
+                    medio_pago=medio_pago,
+                    count=d_count,
+                    total=d_total,
+                )
+            )
+    except IntegrityError:
+        # otro proceso creó la fila entre el UPDATE y el INSERT
+        match.update(values, synchronize_session=False)
+
+
+def record_created(p):
+    """Suma un pago recién insertado (llamar tras el flush, antes del commit)."""
+    _bump(rollup_key(p), 1, p.valor or 0)
+
+
+def record_transition(p, old_estado):
+    """Mueve un pago de old_estado a su estado actual (aprobar/rechazar)."""
+    if old_estado == p.estado:
+        return
+    tz = _tz()
+    _bump(rollup_key(p, old_estado, tz), -1, -(p.valor or 0))
+    _bump(rollup_key(p, tz=tz), 1, p.valor or 0)
+
+
+def rebuild(batch_size=5000):
+    """Recalcula el rollup completo desde payment_request. Retorna filas escritas."""
+    tz = _tz()
+    acc = {}
+    rows = (
+        db.session.query(
+            PaymentRequest.created_at,
+            PaymentRequest.sucursal,
+            PaymentRequest.sociedad,
+            PaymentRequest.estado,
+            PaymentRequest.medio_pago,
+            PaymentRequest.valor,
+        )
+        .filter(PaymentRequest.created_at.isnot(None))
+        .yield_per(batch_size)
+    )
+    for created_at, sucursal, sociedad, estado, medio_pago, valor in rows:
+        key = (
+            local_day(created_at, tz),
+            sucursal or "",
+            sociedad.value if sociedad else "",
+            estado,
+            medio_pago or "",
+        )
+        cnt, total = acc.get(key, (0, 0))
+        acc[key] = (cnt + 1, total + (valor or 0))
+
+    PaymentRollupDaily.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(
+        PaymentRollupDaily,
+        [
+            {
+                "day": k[0],
+                "sucursal": k[1],
+                "sociedad": k[2],
+                "estado": k[3],
+                "medio_pago": k[4],
+                "count": v[0],
+                "total": v[1],
+            }
+            for k, v in acc.items()
+        ],
+    )
+    db.session.commit()
+    return len(acc)
+
+
+def _parse_day(day_str):
+    try:
+        return datetime.datetime.strptime(day_str, "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+
+def can_serve(flt):
+    """El rollup responde si no hay filtros por texto ni por valor individual."""
+    return not flt.q_str and flt.vmin is None and flt.vmax is None
+
+
+def _filtered(query, flt):
+    desde = _parse_day(flt.desde_str) if flt.desde_str else None
+    hasta = _parse_day(flt.hasta_str) if flt.hasta_str else None
+    if desde:
+        query = query.filter(PaymentRollupDaily.day >= desde)
+    if hasta:
+        query = query.filter(PaymentRollupDaily.day <= hasta)
+    if flt.sociedad is not None:
+        query = query.filter(PaymentRollupDaily.sociedad == flt.sociedad.value)
+    return query
+
+
+def aggregates(flt):
+    """Mismo resultado que PaymentFilter.aggregates(), leyendo del rollup."""
+    rows = _filtered(
+        db.session.query(
+            PaymentRollupDaily.estado,
+            func.coalesce(func.sum(PaymentRollupDaily.count), 0),
+            func.coalesce(func.sum(PaymentRollupDaily.total), 0),
+        ),
+        flt,
+    ).group_by(PaymentRollupDaily.estado).all()
+    counts = {e.value: 0 for e in Estado}
+    sums = {e.value: 0 for e in Estado}
+    for est, cnt, total in rows:
+        counts[est.value] = int(cnt)
+        sums[est.value] = int(total or 0)
+    sum_total = sum(sums.values())
+    if flt.estado is not None:
+        listed = counts[flt.estado.value]
+    else:
+        listed = sum(counts.values())
+    return counts, sums, sum_total, listed
+
+
+SERIES_GROUPS = {
+    "estado": PaymentRollupDaily.estado,
+    "sucursal": PaymentRollupDaily.sucursal,
+    "sociedad": PaymentRollupDaily.sociedad,
+    "medio_pago": PaymentRollupDaily.medio_pago,
+}
+
+
+def series(flt, group=None):
+    """Serie diaria [{day, key, count, total}] con el filtro de la bandeja."""
+    cols = [PaymentRollupDaily.day]
+    group_col = SERIES_GROUPS.get(group)
+    if group_col is not None:
+        cols.append(group_col)
+    query = _filtered(
+        db.session.query(
+            *cols,
+            func.sum(PaymentRollupDaily.count),
+            func.sum(PaymentRollupDaily.total),
+        ),
+        flt,
+    )
+    if flt.estado is not None:
+        query = query.filter(PaymentRollupDaily.estado == flt.estado)
+    rows = query.group_by(*cols).order_by(*cols).all()
+    out = []
+    for row in rows:
+        item = {"day": row[0].isoformat()}
+        if group_col is not None:
+            key = row[1]
+            item["key"] = key.value if hasattr(key, "value") else key
+        item["count"] = int(row[-2] or 0)
+        item["total"] = int(row[-1] or 0)
+        out.append(item)
+    return out
@@ -0,0 +1,242 @@
+import re, datetime
+from flask import current_app
+from sqlalchemy import or_, and_, text, literal_column
+from ..extensions import db
+from ..models import PaymentRequest, VerifiedUser
+from .normalize import search_key, prefix_filter
+
+# Estructuras creadas por la migración de búsqueda (una por motor)
+SQLITE_FTS_TABLE = "payment_search"
+MYSQL_FT_INDEX = "ft_payment_request_search"
+PG_TRGM_INDEX = "ix_payment_request_search_trgm"
+# InnoDB ignora tokens más cortos que innodb_ft_min_token_size (3 por defecto)
+MYSQL_MIN_TOKEN = 3
+
+_available = {}
+
+
+def _tokens(q_str):
+    return re.findall(r"\w+", q_str or "", flags=re.UNICODE)
+
+
+def _detect(dialect):
+    """¿Existe la estructura de búsqueda en esta BD? (create_all no la crea)."""
+    try:
+        if dialect == "sqlite":
+            sql = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"
+            return bool(db.session.execute(text(sql), {"n": SQLITE_FTS_TABLE}).first())
+        if dialect == "mysql":
+            sql = (
+                "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                "AND table_name = 'payment_request' AND index_name = :n"
+            )
+            return bool(db.session.execute(text(sql), {"n": MYSQL_FT_INDEX}).first())
+        if dialect == "postgresql":
+            sql = "SELECT 1 FROM pg_indexes WHERE indexname = :n"
+            return bool(db.session.execute(text(sql), {"n": PG_TRGM_INDEX}).first())
+    except Exception:
+        db.session.rollback()
+    return False
+
+
+def backend():
+    """sqlite-fts5 | mysql-fulltext | pg-trgm | like (según motor, migración y SEARCH_BACKEND)."""
+    if (current_app.config.get("SEARCH_BACKEND") or "auto").lower() == "like":
+        return "like"
+    dialect = db.engine.dialect.name
+    key = str(db.engine.url)
+    if key not in _available:
+        _available[key] = _detect(dialect)
+    if not _available[key]:
+        return "like"
+    return {
+        "sqlite": "sqlite-fts5",
+        "mysql": "mysql-fulltext",
+        "postgresql": "pg-trgm",
+    }.get(dialect, "like")
+
+
+def like_filter(q_str):
+    like = f"%{q_str}%"
+    return or_(
+        PaymentRequest.cliente_key.like(f"%{search_key(q_str)}%"),
+        PaymentRequest.medio_pago.like(like),
+        PaymentRequest.sucursal.like(like),
+    )
+
+
+def search_filter(q_str):
+    """
+    Criterio sobre PaymentRequest para el texto libre de la bandeja
+    (cliente, medio de pago, sucursal), sin distinguir mayúsculas ni tildes
+    cuando hay índice. Sin índice utilizable cae a LIKE '%q%'.
+    """
+    tokens = _tokens(q_str)
+    kind = backend() if tokens else "like"
+
+    if kind == "sqlite-fts5":
+        # prefijo por token, todos obligatorios: "ana"* AND "nequi"*
+        match = " AND ".join(f'"{t}"*' for t in tokens)
+        return PaymentRequest.id.in_(
+            text(f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH :fts_q")
+            .bindparams(fts_q=match)
+            .columns(literal_column("rowid"))
+        )
+
+    if kind == "mysql-fulltext" and all(len(t) >= MYSQL_MIN_TOKEN for t in tokens):
+        # la colación *_ci / *_ai_ci de las columnas resuelve mayúsculas y tildes
+        match = " ".join(f"+{t}*" for t in tokens)
+        return text(
+            "MATCH (payment_request.cliente, payment_request.medio_pago, payment_request.sucursal) "
+            "AGAINST (:ft_q IN BOOLEAN MODE)"
+        ).bindparams(ft_q=match)
+
+    if kind == "pg-trgm":
+        # misma expresión que el índice GIN (gin_trgm_ops soporta LIKE '%...%')
+        return text(
+            "f_unaccent(lower(concat_ws(' ', payment_request.cliente, payment_request.medio_pago, "
+            "payment_request.sucursal))) LIKE '%' || f_unaccent(lower(:trgm_q)) || '%'"
+        ).bindparams(trgm_q=q_str)
+
+    return like_filter(q_str)
+
+
+# --- Ruteo de tokens de `q` a columnas indexadas ---
+_PHONE_RE = re.compile(r"\+\d[\d\s\-]{8,}\d")
+_MOBILE_RE = re.compile(r"^3\d{9}$")  # celular colombiano sin indicativo
+_ID_RE = re.compile(r"^#(\d+)$")
+_INT_RE = re.compile(r"^\d{1,9}$")
+_AMOUNT_RE = re.compile(r"^\$?\d{1,3}(?:[.,]\d{3})+$|^\$\d+$")
+_RANGE_RE = re.compile(r"^\$?([\d.,]+)(?:-|\.\.)\$?([\d.,]+)$")
+_DAY_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+def _amount(raw):
+    digits = re.sub(r"[^\d]", "", raw or "")
+    return int(digits) if digits else None
+
+
+def _parse_day(tok):
+    for fmt in _DAY_FORMATS:
+        try:
+            return datetime.datetime.strptime(tok, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+class QueryParts:
+    """Clasificación de `q`: ids, montos, rangos, teléfonos, días/meses y texto libre."""
+
+    __slots__ = ("numbers", "ids", "amounts", "ranges", "phones", "days", "months", "text")
+
+    def __init__(self):
+        self.numbers = []  # enteros ambiguos: id o valor
+        self.ids = []
+        self.amounts = []
+        self.ranges = []
+        self.phones = []
+        self.days = []
+        self.months = []
+        self.text = []
+
+
+def parse_query(q_str):
+    from .verification import normalize_phone
+
+    parts = QueryParts()
+    rest = q_str or ""
+    for m in _PHONE_RE.findall(rest):
+        parts.phones.append(normalize_phone(m))
+    rest = _PHONE_RE.sub(" ", rest)
+
+    for tok in rest.split():
+        if _ID_RE.match(tok):
+            parts.ids.append(int(tok[1:]))
+        elif _MOBILE_RE.match(tok):
+            parts.phones.append(normalize_phone(tok))
+        elif _INT_RE.match(tok):
+            parts.numbers.append(int(tok))
+        elif _AMOUNT_RE.match(tok):
+            parts.amounts.append(_amount(tok))
+        elif _parse_day(tok):
+            parts.days.append(_parse_day(tok))
+        elif _MONTH_RE.match(tok) and 1 <= int(_MONTH_RE.match(tok).group(2)) <= 12:
+            y, mth = (int(x) for x in _MONTH_RE.match(tok).groups())
+            parts.months.append(datetime.date(y, mth, 1))
+        elif _RANGE_RE.match(tok):
+            lo, hi = (_amount(x) for x in _RANGE_RE.match(tok).groups())
+            if lo is not None and hi is not None:
+                parts.ranges.append((min(lo, hi), max(lo, hi)))
+            else:
+                parts.text.append(tok)
+        else:
+            parts.text.append(tok)
+    return parts
+
+
+def _utc_bounds(start, end, tz):
+    """Límites UTC [start, end) de días locales (created_at se guarda en UTC)."""
+    def conv(d):
+        local = datetime.datetime.combine(d, datetime.time()).replace(tzinfo=tz)
+        return local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return conv(start), conv(end)
+
+
+def _day_filter(start, end, tz):
+    lo, hi = _utc_bounds(start, end, tz)
+    return or_(
+        and_(PaymentRequest.created_at >= lo, PaymentRequest.created_at < hi),
+        and_(
+            PaymentRequest.fecha_consignacion >= start,
+            PaymentRequest.fecha_consignacion < end,
+        ),
+    )
+
+
+def smart_filter(q_str, tz=None):
+    """
+    Criterio para `q` de la bandeja. Cada token se rutea a un predicado
+    indexado y todos se combinan con AND:
+      #123 -> id; 12345 -> id o valor; 150.000 / $150000 -> valor;
+      100000-200000 -> rango de valor; +57 300... / 300... -> pagos del
+      usuario verificado con ese celular; 2026-03-01, 01/03/2026, 2026-03 ->
+      día/mes local de creación o de consignación. El resto va al buscador
+      de texto (search_filter).
+    """
+    tz = tz or datetime.timezone.utc
+    parts = parse_query(q_str)
+    crit = []
+    for n in parts.ids:
+        crit.append(PaymentRequest.id == n)
+    for n in parts.numbers:
+        crit.append(or_(PaymentRequest.id == n, PaymentRequest.valor == n))
+    for n in parts.amounts:
+        crit.append(PaymentRequest.valor == n)
+    for lo, hi in parts.ranges:
+        crit.append(PaymentRequest.valor.between(lo, hi))
+    for phone in parts.phones:
+        users = db.session.query(VerifiedUser.telegram_user_id).filter(
+            VerifiedUser.phone_e164 == phone
+        )
+        crit.append(PaymentRequest.telegram_user_id.in_(users.scalar_subquery()))
+    for d in parts.days:
+        crit.append(_day_filter(d, d + datetime.timedelta(days=1), tz))
+    for m in parts.months:
+        nxt = datetime.date(m.year + (m.month == 12), m.month % 12 + 1, 1)
+        crit.append(_day_filter(m, nxt, tz))
+    if parts.text:
+        words = " ".join(parts.text)
+        key = search_key(words)
+        # inicio del nombre del cliente (índice de cliente_key) o texto libre
+        crit.append(
+            or_(
+                prefix_filter(PaymentRequest.cliente_key, key, db.engine.dialect.name),
+                search_filter(words),
+            )
+            if key
+            else search_filter(words)
+        )
+    return and_(*crit) if crit else search_filter(q_str)
@@ -1,5 +1,7 @@
-import os, re, requests, uuid
-from flask import current_app
+import os, re, json, requests, threading, hashlib, tempfile
+from flask import current_app, g, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from werkzeug.utils import secure_filename
 
 # Acepta 'cliente', 'nombre' y 'ref' (alias compat)
@@ -9,6 +11,100 @@ CAPTION_REGEX = re.compile(
 )
 
 
+class TelegramClient:
+    """
+    Cliente HTTP compartido para la Bot API: una requests.Session por proceso
+    con keep-alive y pool acotado (TELEGRAM_POOL_SIZE), así cada llamada
+    reutiliza la conexión TLS en vez de abrir una nueva.
+    """
+
+    # (connect, read) por método de la API; el resto usa DEFAULT_TIMEOUT
+    METHOD_TIMEOUTS = {
+        "answerCallbackQuery": (3.05, 5),
+        "sendMessage": (3.05, 10),
+        "editMessageText": (3.05, 10),
+        "editMessageReplyMarkup": (3.05, 10),
+        "getFile": (3.05, 10),
+        "download": (3.05, 30),
+    }
+    DEFAULT_TIMEOUT = (3.05, 15)
+
+    def __init__(self, app=None):
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bot_api = app.config["BOT_API"]
+        self.file_api = app.config["FILE_API"]
+        self.pool_size = int(app.config.get("TELEGRAM_POOL_SIZE", 10))
+        timeouts = dict(self.METHOD_TIMEOUTS)
+        timeouts.update(app.config.get("TELEGRAM_TIMEOUTS") or {})
+        self.timeouts = timeouts
+        app.extensions["telegram"] = self
+
+    @property
+    def session(self):
+        # Sesión por proceso: tras un fork (gunicorn) no se comparten sockets
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _build_session(self):
+        s = requests.Session()
+        # Solo reintenta errores de conexión (la petición no llegó a Telegram)
+        retry = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.2)
+        adapter = HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        return s
+
+    def timeout_for(self, method):
+        return self.timeouts.get(method, self.DEFAULT_TIMEOUT)
+
+    def request(
+        self, method, json=None, data=None, params=None, http_method="POST", timeout=None, body=None
+    ):
+        """
+        Llama un método de la Bot API y retorna el Response. `body` permite
+        enviar un JSON ya serializado (ver encode_payload).
+        """
+        headers = None
+        if body is not None:
+            data = body
+            headers = {"Content-Type": "application/json"}
+        return self.session.request(
+            http_method,
+            f"{self.bot_api}/{method}",
+            json=json,
+            data=data,
+            params=params,
+            headers=headers,
+            timeout=timeout or self.timeout_for(method),
+        )
+
+    def download(self, file_path, stream=False):
+        return self.session.get(
+            f"{self.file_api}/{file_path}",
+            stream=stream,
+            timeout=self.timeout_for("download"),
+        )
+
+
+def get_client(app=None):
+    return (app or current_app).extensions["telegram"]
+
+
 def parse_amount(txt):
     try:
         return int(re.sub(r"[^\d]", "", txt or ""))
@@ -16,16 +112,74 @@ def parse_amount(txt):
         return None
 
 
+def update_user_id(update):
+    """Usuario que origina un update (mensaje, edición o callback), o None."""
+    for key in ("message", "edited_message", "callback_query"):
+        part = update.get(key) or {}
+        uid = (part.get("from") or {}).get("id")
+        if uid is not None:
+            return str(uid)
+    return None
+
+
+# Outbox: dentro de un update los envíos se encolan y salen tras el commit
+def begin_outbox():
+    g._tg_outbox = []
+
+
+def discard_outbox():
+    g.pop("_tg_outbox", None)
+
+
+def flush_outbox():
+    for fn, args, kwargs in g.pop("_tg_outbox", None) or []:
+        fn(*args, **kwargs)
+
+
+def _deferred(fn, *args, **kwargs):
+    box = g.get("_tg_outbox") if has_app_context() else None
+    if box is None:
+        return False
+    box.append((fn, args, kwargs))
+    return True
+
+
+class PreparedKeyboard(str):
+    """reply_markup ya serializado a JSON; se inserta tal cual en el cuerpo."""
+
+
+def prepare_keyboard(markup):
+    kb = PreparedKeyboard(json.dumps(markup, ensure_ascii=False, separators=(",", ":")))
+    kb.markup = markup
+    return kb
+
+
+# Teclados estáticos serializados una sola vez al importar el módulo
+KEYBOARDS = {}
+
+
+def register_keyboard(name, markup):
+    KEYBOARDS[name] = prepare_keyboard(markup)
+    return KEYBOARDS[name]
+
+
+def encode_payload(payload, kb=None):
+    """Cuerpo JSON (bytes) con reply_markup pre-serializado si lo hay."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    if kb:
+        raw = kb if isinstance(kb, PreparedKeyboard) else prepare_keyboard(kb)
+        body = body[:-1] + ',"reply_markup":' + raw + "}"
+    return body.encode("utf-8")
+
+
 def send_message(chat_id, text, reply_to=None, kb=None):
+    if _deferred(send_message, chat_id, text, reply_to=reply_to, kb=kb):
+        return
     payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
     if reply_to:
         payload["reply_to_message_id"] = reply_to
-    if kb:
-        payload["reply_markup"] = kb
     try:
-        requests.post(
-            f"{current_app.config['BOT_API']}/sendMessage", json=payload, timeout=15
-        )
+        get_client().request("sendMessage", body=encode_payload(payload, kb))
     except Exception as e:
         try:
             current_app.logger.error(f"sendMessage error: {e}")
@@ -34,13 +188,11 @@ def send_message(chat_id, text, reply_to=None, kb=None):
 
 
 def edit_message_text(chat_id, message_id, text, kb=None):
+    if _deferred(edit_message_text, chat_id, message_id, text, kb=kb):
+        return
     payload = {"chat_id": chat_id, "message_id": message_id, "text": text, "parse_mode": "HTML"}
-    if kb:
-        payload["reply_markup"] = kb
     try:
-        requests.post(
-            f"{current_app.config['BOT_API']}/editMessageText", json=payload, timeout=15
-        )
+        get_client().request("editMessageText", body=encode_payload(payload, kb))
     except Exception as e:
         try:
             current_app.logger.error(f"editMessageText error: {e}")
@@ -49,11 +201,11 @@ def edit_message_text(chat_id, message_id, text, kb=None):
 
 
 def edit_message_reply_markup(chat_id, message_id, kb):
-    payload = {"chat_id": chat_id, "message_id": message_id, "reply_markup": kb}
+    if _deferred(edit_message_reply_markup, chat_id, message_id, kb):
+        return
+    payload = {"chat_id": chat_id, "message_id": message_id}
     try:
-        requests.post(
-            f"{current_app.config['BOT_API']}/editMessageReplyMarkup", json=payload, timeout=15
-        )
+        get_client().request("editMessageReplyMarkup", body=encode_payload(payload, kb))
     except Exception as e:
         try:
             current_app.logger.error(f"editMessageReplyMarkup error: {e}")
@@ -62,13 +214,13 @@ def edit_message_reply_markup(chat_id, message_id, kb):
 
 
 def answer_callback_query(callback_id, text=None):
+    if _deferred(answer_callback_query, callback_id, text=text):
+        return
     payload = {"callback_query_id": callback_id}
     if text:
         payload["text"] = text
     try:
-        requests.post(
-            f"{current_app.config['BOT_API']}/answerCallbackQuery", json=payload, timeout=15
-        )
+        get_client().request("answerCallbackQuery", json=payload)
     except Exception as e:
         try:
             current_app.logger.error(f"answerCallbackQuery error: {e}")
@@ -82,11 +234,7 @@ def reply_kb(rows, resize=True, one_time=False):
 
 def get_file_path(file_id):
     try:
-        r = requests.get(
-            f"{current_app.config['BOT_API']}/getFile",
-            params={"file_id": file_id},
-            timeout=15,
-        )
+        r = get_client().request("getFile", params={"file_id": file_id}, http_method="GET")
         r.raise_for_status()
         data = r.json()
     except Exception as e:
@@ -96,30 +244,79 @@ def get_file_path(file_id):
     return data["result"]["file_path"]
 
 
-def download_file(file_path):
-    resp = requests.get(f"{current_app.config['FILE_API']}/{file_path}", timeout=30)
-    resp.raise_for_status()
-    name = secure_filename(os.path.basename(file_path))
-    base, ext = os.path.splitext(name)
-    dest = os.path.join(current_app.config["EVID_DIR"], name)
-    if os.path.exists(dest):
-        name = f"{base}_{uuid.uuid4().hex[:8]}{ext}"
-        dest = os.path.join(current_app.config["EVID_DIR"], name)
-    with open(dest, "wb") as f:
-        f.write(resp.content)
-    return name
+class EvidenceTooLarge(RuntimeError):
+    """La descarga superó el presupuesto de EVID_MAX_MB."""
+
+
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+def evidence_name(sha256, file_path):
+    """Nombre direccionado por contenido: hash + extensión original."""
+    ext = os.path.splitext(secure_filename(os.path.basename(file_path or "")))[1].lower()
+    return f"{sha256}{ext}"
+
+
+def download_file(file_path, max_bytes=None):
+    """
+    Descarga en streaming a un temporal dentro de EVID_DIR, calculando SHA-256 y
+    bytes en la misma pasada; aborta apenas se supera max_bytes. Al terminar
+    renombra atómicamente a "<sha256><ext>" (almacenamiento por contenido: un
+    archivo idéntico se guarda una sola vez). Retorna (nombre, sha256, bytes).
+    """
+    evid_dir = current_app.config["EVID_DIR"]
+    resp = get_client().download(file_path, stream=True)
+    try:
+        resp.raise_for_status()
+        declared = int(resp.headers.get("Content-Length") or 0)
+        if max_bytes and declared > max_bytes:
+            raise EvidenceTooLarge(f"{declared} > {max_bytes} bytes")
+        fd, tmp_path = tempfile.mkstemp(dir=evid_dir, prefix=".dl-", suffix=".part")
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise EvidenceTooLarge(f"> {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            name = evidence_name(sha256, file_path)
+            dest = os.path.join(evid_dir, name)
+            if os.path.exists(dest):
+                os.remove(tmp_path)  # mismo contenido ya almacenado
+            else:
+                os.replace(tmp_path, dest)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    finally:
+        resp.close()
+    return name, sha256, size
 
 
 # Teclados
-MAIN_KB = reply_kb(
-    [
-        [{"text": "Reportar pago"}],
-        [{"text": "Ver estado"}],
-        [{"text": "Ayuda"}],
-        [{"text": "Cerrar sesión"}],
-    ]
+MAIN_KB = register_keyboard(
+    "main",
+    reply_kb(
+        [
+            [{"text": "Reportar pago"}],
+            [{"text": "Ver estado"}],
+            [{"text": "Ayuda"}],
+            [{"text": "Cerrar sesión"}],
+        ]
+    ),
+)
+CANCEL_KB = register_keyboard(
+    "cancel", reply_kb([[{"text": "Cancelar"}, {"text": "Menú principal"}]])
 )
-CANCEL_KB = reply_kb([[{"text": "Cancelar"}, {"text": "Menú principal"}]])
 
 MEDIOS_PAGO = [
     "Bancolombia",
@@ -134,7 +331,7 @@ MEDIOS_PAGO = [
 MEDIOS_SET = {m.lower() for m in MEDIOS_PAGO}
 
 
-def medio_keyboard_rows():
+def _medio_rows():
     rows, row = [], []
     for i, m in enumerate(MEDIOS_PAGO, 1):
         row.append({"text": m})
@@ -147,5 +344,12 @@ def medio_keyboard_rows():
     return reply_kb(rows)
 
 
+MEDIO_KB = register_keyboard("medio", _medio_rows())
+
+
+def medio_keyboard_rows():
+    return MEDIO_KB
+
+
 def set_webhook(app, url: str):
-    requests.post(f"{app.config['BOT_API']}/setWebhook", data={"url": url}, timeout=15)
+    return get_client(app).request("setWebhook", data={"url": url})
@@ -0,0 +1,139 @@
+import os, threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Variantes por lado máximo (px). "thumb" para listados, "medium" para el visor
+SIZES = {"thumb": 320, "medium": 1280}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+THUMBS_SUBDIR = "thumbs"
+
+_executor = None
+_executor_lock = threading.Lock()
+# Renders en curso por evidencia (por proceso): no se encola dos veces la misma
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def is_image(filename):
+    return os.path.splitext(filename or "")[1].lower() in IMAGE_EXTS
+
+
+def variant_name(filename, size, fmt="webp"):
+    """Ruta relativa a EVID_DIR de la variante `size` de una evidencia."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    ext = "webp" if fmt == "webp" else "jpg"
+    return f"{THUMBS_SUBDIR}/{stem}_{size}.{ext}"
+
+
+def render_variants(src_path, evid_dir, filename, fmt="webp", quality=80, sizes=None, force=False):
+    """
+    Genera las variantes de una imagen (se ejecuta en el pool de procesos).
+    Retorna la lista de variantes escritas.
+    """
+    from PIL import Image, ImageOps
+
+    written = []
+    sizes = sizes or SIZES
+    os.makedirs(os.path.join(evid_dir, THUMBS_SUBDIR), exist_ok=True)
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        for size, max_px in sizes.items():
+            rel = variant_name(filename, size, fmt)
+            dest = os.path.join(evid_dir, rel)
+            if os.path.exists(dest) and not force:
+                continue
+            variant = im.copy()
+            variant.thumbnail((max_px, max_px))
+            tmp = f"{dest}.{os.getpid()}.part"
+            if fmt == "webp":
+                variant.save(tmp, "WEBP", quality=quality, method=4)
+            else:
+                variant.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp, dest)
+            written.append(rel)
+    return written
+
+
+def render_embed(src_path, dest_path, max_w, max_h, quality=70):
+    """
+    Copia reducida (JPEG) de una imagen para incrustar en un xlsx; se ejecuta
+    en el pool de procesos. Retorna (ancho, alto) del resultado.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(src_path) as im:
+        # JPEG: decodifica directo a escala reducida (mucho más rápido)
+        im.draft("RGB", (max(max_w, max_h), max(max_w, max_h)))
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        im.thumbnail((max_w, max_h))
+        im.save(dest_path, "JPEG", quality=quality, optimize=True)
+        return im.size
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=int(app.config.get("THUMB_WORKERS", 2))
+                )
+    return _executor
+
+
+def submit_variants(app, filename, force=False):
+    """
+    Encola la generación de variantes sin bloquear al llamador.
+    Retorna el Future (el ya encolado si esa evidencia sigue en curso), o None
+    si la evidencia no es una imagen.
+    """
+    if not is_image(filename):
+        return None
+    evid_dir = app.config["EVID_DIR"]
+    src = os.path.join(evid_dir, filename)
+    if not os.path.exists(src):
+        return None
+    with _pending_lock:
+        future = _pending.get(filename)
+        if future is not None and not force:
+            return future
+        future = _get_executor(app).submit(
+            render_variants,
+            src,
+            evid_dir,
+            filename,
+            app.config.get("THUMB_FORMAT", "webp"),
+            int(app.config.get("THUMB_QUALITY", 80)),
+            None,
+            force,
+        )
+        _pending[filename] = future
+
+    def _done(f):
+        with _pending_lock:
+            if _pending.get(filename) is f:
+                del _pending[filename]
+        exc = f.exception()
+        if exc:
+            app.logger.error(f"Miniaturas {filename}: {exc}")
+
+    future.add_done_callback(_done)
+    return future
+
+
+def submit_embed(app, src_path, dest_path, max_w, max_h, quality=70):
+    """Encola render_embed en el pool de miniaturas. Retorna el Future."""
+    return _get_executor(app).submit(render_embed, src_path, dest_path, max_w, max_h, quality)
+
+
+def variant_path(app, filename, size):
+    """Ruta relativa de la variante si ya existe en disco; None si no."""
+    if size not in SIZES or not is_image(filename):
+        return None
+    rel = variant_name(filename, size, app.config.get("THUMB_FORMAT", "webp"))
+    if os.path.exists(os.path.join(app.config["EVID_DIR"], rel)):
+        return rel
+    return None
@@ -1,5 +1,6 @@
 from pyngrok import ngrok, conf
-import atexit, requests
+import atexit
+from .telegram import set_webhook
 
 
 def setup_dev_tunnel_and_webhook(app):
@@ -46,9 +47,7 @@ def setup_dev_tunnel_and_webhook(app):
         else:
             raise
     webhook_url = f"{public_url}/telegram/webhook"
-    r = requests.post(
-        f"{app.config['BOT_API']}/setWebhook", data={"url": webhook_url}, timeout=15
-    )
+    r = set_webhook(app, webhook_url)
     if not r.ok or not r.json().get("ok"):
         app.logger.error(f"setWebhook error: {r.text}")
 
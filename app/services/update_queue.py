@@ -0,0 +1,222 @@
+import json, datetime, threading
+from flask import current_app
+from sqlalchemy import func, exists
+from sqlalchemy.orm import aliased
+from ..extensions import db
+from ..models import InboundUpdate, UpdateStatus
+from .telegram import update_user_id
+from .idempotency import purge_processed
+
+
+def enqueue_update(update):
+    """Guarda el update crudo en la cola y confirma de inmediato."""
+    item = InboundUpdate(
+        update_id=update.get("update_id"),
+        telegram_user_id=update_user_id(update),
+        payload=json.dumps(update, ensure_ascii=False),
+        status=UpdateStatus.PENDIENTE,
+    )
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def park_failed(update, error, attempts):
+    """
+    Deja en la cola como ERROR un update que agotó sus reintentos fuera de
+    ella (modo poll), para revisarlo o reencolarlo a mano.
+    """
+    now = datetime.datetime.utcnow()
+    item = InboundUpdate(
+        update_id=update.get("update_id"),
+        telegram_user_id=update_user_id(update),
+        payload=json.dumps(update, ensure_ascii=False),
+        status=UpdateStatus.ERROR,
+        attempts=attempts,
+        last_error=str(error)[:2000],
+        processed_at=now,
+    )
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def claim_next(batch=20):
+    """
+    Reserva el siguiente update listo. Un update solo es elegible si no hay
+    otro anterior del mismo usuario pendiente o en proceso: así se conserva
+    el orden por usuario aunque haya varios workers/procesos.
+    Retorna (id, payload) o None.
+    """
+    now = datetime.datetime.utcnow()
+    earlier = aliased(InboundUpdate)
+    blocked = exists().where(
+        earlier.telegram_user_id == InboundUpdate.telegram_user_id,
+        earlier.id < InboundUpdate.id,
+        earlier.status.in_([UpdateStatus.PENDIENTE, UpdateStatus.PROCESANDO]),
+    )
+    candidates = (
+        db.session.query(InboundUpdate.id, InboundUpdate.payload)
+        .filter(
+            InboundUpdate.status == UpdateStatus.PENDIENTE,
+            InboundUpdate.available_at <= now,
+            ~blocked,
+        )
+        .order_by(InboundUpdate.id.asc())
+        .limit(batch)
+        .all()
+    )
+    db.session.rollback()
+    for cid, payload in candidates:
+        # UPDATE condicional: solo un worker gana la reserva
+        n = (
+            InboundUpdate.query.filter(
+                InboundUpdate.id == cid,
+                InboundUpdate.status == UpdateStatus.PENDIENTE,
+            ).update(
+                {
+                    InboundUpdate.status: UpdateStatus.PROCESANDO,
+                    InboundUpdate.locked_at: now,
+                    InboundUpdate.attempts: InboundUpdate.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.session.commit()
+        if n:
+            return cid, payload
+    return None
+
+
+def mark_done(item_id):
+    InboundUpdate.query.filter_by(id=item_id).update(
+        {
+            InboundUpdate.status: UpdateStatus.HECHO,
+            InboundUpdate.processed_at: datetime.datetime.utcnow(),
+            InboundUpdate.last_error: None,
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def mark_failed(item_id, error):
+    """Reintenta con backoff; tras QUEUE_MAX_ATTEMPTS queda en ERROR (libera al usuario)."""
+    item = db.session.get(InboundUpdate, item_id)
+    if not item:
+        return
+    max_attempts = int(current_app.config.get("QUEUE_MAX_ATTEMPTS", 5))
+    now = datetime.datetime.utcnow()
+    item.last_error = str(error)[:2000]
+    item.locked_at = None
+    if (item.attempts or 0) >= max_attempts:
+        item.status = UpdateStatus.ERROR
+        item.processed_at = now
+    else:
+        item.status = UpdateStatus.PENDIENTE
+        item.available_at = now + datetime.timedelta(seconds=2 ** (item.attempts or 1))
+    db.session.commit()
+
+
+def requeue_stale():
+    """Devuelve a PENDIENTE los updates reservados por un worker que murió."""
+    timeout = int(current_app.config.get("QUEUE_LOCK_TIMEOUT_SECONDS", 300))
+    threshold = datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout)
+    n = InboundUpdate.query.filter(
+        InboundUpdate.status == UpdateStatus.PROCESANDO,
+        InboundUpdate.locked_at < threshold,
+    ).update(
+        {InboundUpdate.status: UpdateStatus.PENDIENTE, InboundUpdate.locked_at: None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return n
+
+
+def purge_done():
+    hours = int(current_app.config.get("QUEUE_RETENTION_HOURS", 72))
+    threshold = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    n = InboundUpdate.query.filter(
+        InboundUpdate.status == UpdateStatus.HECHO,
+        InboundUpdate.processed_at < threshold,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+def queue_stats():
+    """Profundidad de la cola y lag (segundos) del update pendiente más antiguo."""
+    rows = (
+        db.session.query(InboundUpdate.status, func.count(), func.min(InboundUpdate.created_at))
+        .filter(InboundUpdate.status != UpdateStatus.HECHO)
+        .group_by(InboundUpdate.status)
+        .all()
+    )
+    stats = {"pending": 0, "processing": 0, "error": 0, "lag_seconds": 0.0}
+    keys = {
+        UpdateStatus.PENDIENTE: "pending",
+        UpdateStatus.PROCESANDO: "processing",
+        UpdateStatus.ERROR: "error",
+    }
+    for status, cnt, oldest in rows:
+        key = keys.get(status)
+        if not key:
+            continue
+        stats[key] = int(cnt)
+        if status == UpdateStatus.PENDIENTE and oldest:
+            lag = (datetime.datetime.utcnow() - oldest).total_seconds()
+            stats["lag_seconds"] = round(max(lag, 0.0), 3)
+    return stats
+
+
+def run_workers(app, handler, concurrency=4, poll_interval=0.5):
+    """
+    Pool de hilos que drena la cola llamando handler(update) por cada item.
+    Bloquea hasta Ctrl+C.
+    """
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    claimed = claim_next()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"bot-worker claim error: {e}")
+                    claimed = None
+                if not claimed:
+                    stop.wait(poll_interval)
+                    continue
+                item_id, payload = claimed
+                try:
+                    handler(json.loads(payload))
+                    mark_done(item_id)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.exception(f"bot-worker update {item_id} error: {e}")
+                    mark_failed(item_id, e)
+
+    threads = [
+        threading.Thread(target=_loop, name=f"bot-worker-{i}", daemon=True)
+        for i in range(max(1, concurrency))
+    ]
+    for t in threads:
+        t.start()
+    try:
+        while not stop.is_set():
+            # mantenimiento periódico: locks huérfanos y limpieza de HECHO
+            with app.app_context():
+                try:
+                    requeue_stale()
+                    purge_done()
+                    purge_processed()
+                    app.logger.info(f"bot-worker cola: {queue_stats()}")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"bot-worker mantenimiento error: {e}")
+            stop.wait(60)
+    except KeyboardInterrupt:
+        stop.set()
+    for t in threads:
+        t.join(timeout=30)
@@ -1,8 +1,8 @@
-import re, datetime
+import re, time, datetime, threading
 from flask import current_app
 from ..extensions import db
 from ..models import ReporterWhitelist, VerifiedUser
-from .telegram import send_message, reply_kb
+from .telegram import send_message, reply_kb, register_keyboard
 
 
 def normalize_phone(raw: str, default_cc="57"):
@@ -16,44 +16,124 @@ def normalize_phone(raw: str, default_cc="57"):
     return f"+{digits}"
 
 
-def send_request_contact(
-    chat_id, text="Para continuar, comparte tu número de celular."
-):
-    kb = reply_kb(
+CONTACT_KB = register_keyboard(
+    "contact",
+    reply_kb(
         [
             [{"text": "Compartir mi número 📲", "request_contact": True}],
             [{"text": "Ayuda"}, {"text": "Menú principal"}],
         ],
         one_time=True,
-    )
-    send_message(chat_id, text, kb=kb)
+    ),
+)
+
+
+def send_request_contact(
+    chat_id, text="Para continuar, comparte tu número de celular."
+):
+    send_message(chat_id, text, kb=CONTACT_KB)
+
+
+class VerifiedInfo:
+    """Resultado de verificación ya resuelto (sesión + whitelist) para cachear."""
+
+    __slots__ = ("telegram_user_id", "phone_e164", "sucursal", "sociedad", "enabled", "verified_at")
+
+    def __init__(self, telegram_user_id, phone_e164, sucursal, sociedad, enabled, verified_at):
+        self.telegram_user_id = telegram_user_id
+        self.phone_e164 = phone_e164
+        self.sucursal = sucursal
+        self.sociedad = sociedad
+        self.enabled = enabled
+        self.verified_at = verified_at
+
+
+# Caché por proceso: telegram_user_id -> (VerifiedInfo, expira_en)
+_verif_cache = {}
+_verif_lock = threading.Lock()
+
+
+def _cache_get(uid):
+    with _verif_lock:
+        entry = _verif_cache.get(uid)
+        if entry and entry[1] >= time.monotonic():
+            return entry[0]
+        _verif_cache.pop(uid, None)
+    return None
+
+
+def _cache_put(uid, info):
+    ttl = int(current_app.config.get("VERIF_CACHE_SECONDS", 60))
+    if ttl <= 0:
+        return
+    with _verif_lock:
+        _verif_cache[uid] = (info, time.monotonic() + ttl)
+
+
+def invalidate_verification(telegram_user_id=None, phone=None):
+    """
+    Invalida la caché de verificación. Sin argumentos la vacía completa.
+    Las ediciones de whitelist la invalidan en el proceso que las atiende;
+    en los demás procesos rige el TTL corto (VERIF_CACHE_SECONDS).
+    """
+    with _verif_lock:
+        if telegram_user_id is None and phone is None:
+            _verif_cache.clear()
+            return
+        for uid, (info, _) in list(_verif_cache.items()):
+            if (telegram_user_id is not None and uid == str(telegram_user_id)) or (
+                phone is not None and info.phone_e164 == phone
+            ):
+                del _verif_cache[uid]
 
 
 def get_verified(telegram_user_id: int):
     return VerifiedUser.query.filter_by(telegram_user_id=str(telegram_user_id)).first()
 
 
+def _expired(verified_at):
+    ttl = int(current_app.config["VERIF_TTL_MINUTES"])
+    if ttl <= 0 or not verified_at:
+        return False
+    delta = datetime.datetime.utcnow() - verified_at
+    return delta.total_seconds() > ttl * 60
+
+
 def check_verification(from_user):
-    vu = get_verified(from_user)
+    """
+    (True, VerifiedInfo) o (False, motivo). No hace commit: las bajas de
+    sesión se confirman con la unidad de trabajo del update.
+    """
+    uid = str(from_user)
+    info = _cache_get(uid)
+    if info is not None:
+        # el TTL de la sesión se sigue validando sin consultar la BD
+        if not _expired(info.verified_at):
+            return True, info
+        invalidate_verification(telegram_user_id=uid)
+
+    vu = get_verified(uid)
     if not vu:
         return False, "no_session"
-    ttl = int(current_app.config["VERIF_TTL_MINUTES"])
-    if ttl > 0:
-        delta = datetime.datetime.utcnow() - vu.verified_at
-        if delta.total_seconds() > ttl * 60:
-            db.session.delete(vu)
-            db.session.commit()
-            return False, "expired"
+    if _expired(vu.verified_at):
+        db.session.delete(vu)
+        return False, "expired"
     wl = ReporterWhitelist.query.filter_by(phone_e164=vu.phone_e164).first()
     if not wl:
         db.session.delete(vu)
-        db.session.commit()
         return False, "not_found"
     if not wl.enabled:
         db.session.delete(vu)
-        db.session.commit()
         return False, "disabled"
     if wl.sucursal and wl.sucursal != vu.sucursal:
         vu.sucursal = wl.sucursal
-        db.session.commit()
-    return True, vu
+    info = VerifiedInfo(
+        telegram_user_id=uid,
+        phone_e164=vu.phone_e164,
+        sucursal=vu.sucursal,
+        sociedad=wl.sociedad,
+        enabled=wl.enabled,
+        verified_at=vu.verified_at,
+    )
+    _cache_put(uid, info)
+    return True, info
@@ -0,0 +1,91 @@
+"""add payment_rollup_daily
+
+Revision ID: 2f8b6d4e9a17
+Revises: 7c2a9e5d1f04
+Create Date: 2026-01-26 09:41:12.118304
+
+"""
+import os
+import datetime
+from zoneinfo import ZoneInfo
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2f8b6d4e9a17'
+down_revision = '7c2a9e5d1f04'
+branch_labels = None
+depends_on = None
+
+
+def _backfill(rollup):
+    """Carga inicial desde payment_request (día local según TIMEZONE)."""
+    try:
+        tz = ZoneInfo(os.getenv("TIMEZONE", "America/Bogota"))
+    except Exception:
+        tz = datetime.timezone.utc
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.text(
+            "SELECT created_at, sucursal, sociedad, estado, medio_pago, valor "
+            "FROM payment_request WHERE created_at IS NOT NULL"
+        )
+    )
+    acc = {}
+    for created_at, sucursal, sociedad, estado, medio_pago, valor in rows:
+        if isinstance(created_at, str):
+            created_at = datetime.datetime.fromisoformat(created_at)
+        day = created_at.replace(tzinfo=datetime.timezone.utc).astimezone(tz).date()
+        key = (day, sucursal or "", sociedad or "", estado, medio_pago or "")
+        cnt, total = acc.get(key, (0, 0))
+        acc[key] = (cnt + 1, total + (valor or 0))
+    if acc:
+        op.bulk_insert(
+            rollup,
+            [
+                {
+                    'day': k[0],
+                    'sucursal': k[1],
+                    'sociedad': k[2],
+                    'estado': k[3],
+                    'medio_pago': k[4],
+                    'count': v[0],
+                    'total': v[1],
+                }
+                for k, v in acc.items()
+            ],
+        )
+
+
+def upgrade():
+    rollup = op.create_table(
+        'payment_rollup_daily',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('sucursal', sa.String(length=120), nullable=False),
+        sa.Column('sociedad', sa.String(length=20), nullable=False),
+        # el tipo "estado" ya existe (payment_request.estado): en Postgres no se vuelve a crear
+        sa.Column(
+            'estado',
+            postgresql.ENUM('PENDIENTE', 'APROBADO', 'RECHAZADO', name='estado', create_type=False),
+            nullable=False,
+        ),
+        sa.Column('medio_pago', sa.String(length=80), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'sucursal', 'sociedad', 'estado', 'medio_pago', name='uq_rollup_daily_key'),
+    )
+    with op.batch_alter_table('payment_rollup_daily', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_rollup_daily_day'), ['day'], unique=False)
+
+    _backfill(rollup)
+
+
+def downgrade():
+    with op.batch_alter_table('payment_rollup_daily', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_rollup_daily_day'))
+
+    op.drop_table('payment_rollup_daily')
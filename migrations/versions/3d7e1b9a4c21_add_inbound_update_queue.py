@@ -0,0 +1,49 @@
+"""add inbound_update queue
+
+Revision ID: 3d7e1b9a4c21
+Revises: 48a592c9d267
+Create Date: 2026-01-12 10:14:03.512774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d7e1b9a4c21'
+down_revision = '48a592c9d267'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inbound_update',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('update_id', sa.BigInteger(), nullable=True),
+        sa.Column('telegram_user_id', sa.String(length=50), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.Enum('PENDIENTE', 'PROCESANDO', 'HECHO', 'ERROR', name='updatestatus'), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('inbound_update', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_inbound_update_update_id'), ['update_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_inbound_update_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_inbound_update_status_id', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_inbound_update_user_status', ['telegram_user_id', 'status', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inbound_update', schema=None) as batch_op:
+        batch_op.drop_index('ix_inbound_update_user_status')
+        batch_op.drop_index('ix_inbound_update_status_id')
+        batch_op.drop_index(batch_op.f('ix_inbound_update_created_at'))
+        batch_op.drop_index(batch_op.f('ix_inbound_update_update_id'))
+
+    op.drop_table('inbound_update')
@@ -0,0 +1,105 @@
+"""add payment search index (fts5 / fulltext / pg_trgm)
+
+Revision ID: 6d1e3f7a2b58
+Revises: 2f8b6d4e9a17
+Create Date: 2026-02-02 11:07:45.630921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d1e3f7a2b58'
+down_revision = '2f8b6d4e9a17'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    # tabla FTS5 de contenido externo: el texto vive en payment_request
+    """
+    CREATE VIRTUAL TABLE payment_search USING fts5(
+        cliente, medio_pago, sucursal,
+        content='payment_request', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER payment_search_ai AFTER INSERT ON payment_request BEGIN
+        INSERT INTO payment_search(rowid, cliente, medio_pago, sucursal)
+        VALUES (new.id, new.cliente, new.medio_pago, new.sucursal);
+    END
+    """,
+    """
+    CREATE TRIGGER payment_search_ad AFTER DELETE ON payment_request BEGIN
+        INSERT INTO payment_search(payment_search, rowid, cliente, medio_pago, sucursal)
+        VALUES ('delete', old.id, old.cliente, old.medio_pago, old.sucursal);
+    END
+    """,
+    """
+    CREATE TRIGGER payment_search_au AFTER UPDATE OF cliente, medio_pago, sucursal ON payment_request BEGIN
+        INSERT INTO payment_search(payment_search, rowid, cliente, medio_pago, sucursal)
+        VALUES ('delete', old.id, old.cliente, old.medio_pago, old.sucursal);
+        INSERT INTO payment_search(rowid, cliente, medio_pago, sucursal)
+        VALUES (new.id, new.cliente, new.medio_pago, new.sucursal);
+    END
+    """,
+    "INSERT INTO payment_search(payment_search) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS payment_search_au",
+    "DROP TRIGGER IF EXISTS payment_search_ad",
+    "DROP TRIGGER IF EXISTS payment_search_ai",
+    "DROP TABLE IF EXISTS payment_search",
+]
+
+PG_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE; el envoltorio permite usarlo en un índice
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+    $$ SELECT public.unaccent('public.unaccent', $1) $$
+    """,
+    """
+    CREATE INDEX ix_payment_request_search_trgm ON payment_request
+    USING gin (f_unaccent(lower(concat_ws(' ', cliente, medio_pago, sucursal))) gin_trgm_ops)
+    """,
+]
+
+PG_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_payment_request_search_trgm",
+    "DROP FUNCTION IF EXISTS f_unaccent(text)",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for stmt in SQLITE_UPGRADE:
+            op.execute(stmt)
+    elif dialect == 'mysql':
+        # InnoDB mantiene el índice FULLTEXT en cada INSERT/UPDATE
+        op.execute(
+            "CREATE FULLTEXT INDEX ft_payment_request_search "
+            "ON payment_request (cliente, medio_pago, sucursal)"
+        )
+    elif dialect == 'postgresql':
+        for stmt in PG_UPGRADE:
+            op.execute(stmt)
+    # otros motores: la búsqueda usa LIKE
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for stmt in SQLITE_DOWNGRADE:
+            op.execute(stmt)
+    elif dialect == 'mysql':
+        op.execute("DROP INDEX ft_payment_request_search ON payment_request")
+    elif dialect == 'postgresql':
+        for stmt in PG_DOWNGRADE:
+            op.execute(stmt)
@@ -0,0 +1,36 @@
+"""add bot_cursor
+
+Revision ID: 7c2a9e5d1f04
+Revises: e41c8f0b7d52
+Create Date: 2026-01-19 08:55:37.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2a9e5d1f04'
+down_revision = 'e41c8f0b7d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bot_cursor',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=40), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('bot_cursor', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_bot_cursor_name'), ['name'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('bot_cursor', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_bot_cursor_name'))
+
+    op.drop_table('bot_cursor')
@@ -0,0 +1,69 @@
+"""composite and partial indexes on payment_request
+
+Revision ID: c8d2f4a6b913
+Revises: a3c5e8f1d276
+Create Date: 2026-02-09 10:03:51.208466
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8d2f4a6b913'
+down_revision = 'a3c5e8f1d276'
+branch_labels = None
+depends_on = None
+
+
+COMPOSITE = [
+    ('ix_payment_request_created_id', ['created_at', 'id']),
+    ('ix_payment_request_estado_created', ['estado', 'created_at', 'id']),
+    ('ix_payment_request_sociedad_created', ['sociedad', 'created_at', 'id']),
+    ('ix_payment_request_user_cliente_created', ['telegram_user_id', 'cliente', 'created_at']),
+]
+PARTIAL = ('ix_payment_request_pendiente', ['created_at', 'id'], "estado = 'PENDIENTE'")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # CONCURRENTLY no bloquea escrituras, pero no puede ir en una transacción
+        with op.get_context().autocommit_block():
+            for name, cols in COMPOSITE:
+                op.create_index(name, 'payment_request', cols, postgresql_concurrently=True, if_not_exists=True)
+            name, cols, where = PARTIAL
+            op.create_index(
+                name, 'payment_request', cols,
+                postgresql_where=sa.text(where), postgresql_concurrently=True, if_not_exists=True,
+            )
+    elif dialect == 'mysql':
+        # DDL en línea de InnoDB: lecturas y escrituras siguen durante la construcción
+        for name, cols in COMPOSITE:
+            op.execute(
+                f"CREATE INDEX {name} ON payment_request ({', '.join(cols)}) "
+                "ALGORITHM=INPLACE LOCK=NONE"
+            )
+    else:
+        with op.batch_alter_table('payment_request', schema=None) as batch_op:
+            for name, cols in COMPOSITE:
+                batch_op.create_index(name, cols, unique=False)
+        name, cols, where = PARTIAL
+        op.create_index(name, 'payment_request', cols, sqlite_where=sa.text(where))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    names = [name for name, _ in COMPOSITE]
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name in names + [PARTIAL[0]]:
+                op.drop_index(name, table_name='payment_request', postgresql_concurrently=True, if_exists=True)
+    elif dialect == 'mysql':
+        for name in names:
+            op.execute(f"DROP INDEX {name} ON payment_request ALGORITHM=INPLACE LOCK=NONE")
+    else:
+        op.drop_index(PARTIAL[0], table_name='payment_request')
+        with op.batch_alter_table('payment_request', schema=None) as batch_op:
+            for name in names:
+                batch_op.drop_index(name)
@@ -0,0 +1,37 @@
+"""add processed_update ledger
+
+Revision ID: e41c8f0b7d52
+Revises: 5be0d7a3f6c9
+Create Date: 2026-01-15 11:48:29.017643
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41c8f0b7d52'
+down_revision = '5be0d7a3f6c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'processed_update',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('update_key', sa.String(length=80), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('processed_update', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_processed_update_update_key'), ['update_key'], unique=True)
+        batch_op.create_index(batch_op.f('ix_processed_update_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('processed_update', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_processed_update_created_at'))
+        batch_op.drop_index(batch_op.f('ix_processed_update_update_key'))
+
+    op.drop_table('processed_update')
@@ -0,0 +1,87 @@
+"""add cliente_key to payment_request
+
+Revision ID: e5a7c9b1d348
+Revises: c8d2f4a6b913
+Create Date: 2026-02-12 17:36:20.915502
+
+"""
+import re
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9b1d348'
+down_revision = 'c8d2f4a6b913'
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _search_key(text):
+    """Copia de app.services.normalize.search_key (la migración no importa la app)."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SPACES_RE.sub(" ", stripped.casefold()).strip()[:120]
+
+
+def _backfill():
+    """cliente_key de las filas existentes, por lotes de id (búsqueda y "Ver estado" dependen de ella)."""
+    bind = op.get_bind()
+    table = sa.table(
+        'payment_request',
+        sa.column('id', sa.Integer),
+        sa.column('cliente', sa.String),
+        sa.column('cliente_key', sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, table.c.cliente)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(BATCH)
+        ).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            table.update()
+            .where(table.c.id == sa.bindparam('pid'))
+            .values(cliente_key=sa.bindparam('key')),
+            [{'pid': pid, 'key': _search_key(cliente)} for pid, cliente in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('payment_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cliente_key', sa.String(length=120), nullable=True))
+        batch_op.create_index(
+            'ix_payment_request_cliente_key', ['cliente_key'], unique=False,
+            postgresql_ops={'cliente_key': 'varchar_pattern_ops'},
+        )
+        batch_op.create_index(
+            'ix_payment_request_user_cliente_key', ['telegram_user_id', 'cliente_key'], unique=False,
+            postgresql_ops={'cliente_key': 'varchar_pattern_ops'},
+        )
+        # "Ver estado" ya no filtra por cliente exacto: este índice solo costaba escrituras
+        batch_op.drop_index('ix_payment_request_user_cliente_created')
+
+    _backfill()
+
+
+def downgrade():
+    with op.batch_alter_table('payment_request', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_payment_request_user_cliente_created',
+            ['telegram_user_id', 'cliente', 'created_at'],
+            unique=False,
+        )
+        batch_op.drop_index('ix_payment_request_user_cliente_key')
+        batch_op.drop_index('ix_payment_request_cliente_key')
+        batch_op.drop_column('cliente_key')
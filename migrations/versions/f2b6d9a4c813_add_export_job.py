@@ -0,0 +1,49 @@
+"""add export_job
+
+Revision ID: f2b6d9a4c813
+Revises: e5a7c9b1d348
+Create Date: 2026-02-16 11:02:47.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d9a4c813'
+down_revision = 'e5a7c9b1d348'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'export_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=32), nullable=False),
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('params', sa.Text(), nullable=False),
+        sa.Column('include_images', sa.Boolean(), nullable=False),
+        sa.Column('status', sa.Enum('PENDIENTE', 'PROCESANDO', 'HECHO', 'ERROR', name='exportstatus'), nullable=False),
+        sa.Column('progress', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('filename', sa.String(length=200), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('export_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_export_job_token'), ['token'], unique=True)
+        batch_op.create_index(batch_op.f('ix_export_job_cache_key'), ['cache_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_export_job_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('export_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_export_job_created_at'))
+        batch_op.drop_index(batch_op.f('ix_export_job_cache_key'))
+        batch_op.drop_index(batch_op.f('ix_export_job_token'))
+
+    op.drop_table('export_job')